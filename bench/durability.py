@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Cost of each durability mode (none / file / file+dir) for a single-file
+`replace` and a multi-file `write`.
+
+Usage:
+    python3 bench/durability.py [--runs N] [--dir PATH]
+
+--dir selects the filesystem to measure (fsync cost depends heavily on it).
+Output: JSON report on stdout.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import edit
+import paste
+from core import DURABILITY_MODES
+
+DEFAULT_RUNS = 20
+LINES = 10000
+WRITE_FILES = 100
+
+
+def _median_ms(fn, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def bench_mode(workdir, mode, runs):
+    target = os.path.join(workdir, "replace.py")
+    with open(target, "w") as f:
+        f.writelines(f"value_{i} = {i}\n" for i in range(LINES))
+
+    spec = {
+        "files": [
+            {"file": os.path.join(workdir, "out", f"f{i}.py"), "content": "x = 1\n" * 50}
+            for i in range(WRITE_FILES)
+        ],
+        "durability": mode,
+    }
+    return {
+        "replace_ms": _median_ms(
+            lambda: edit.replace(target, LINES // 2, LINES // 2, "changed = 1\n", durability=mode),
+            runs,
+        ),
+        f"write_{WRITE_FILES}_files_ms": _median_ms(lambda: paste.write(spec), max(1, runs // 4)),
+    }
+
+
+def main():
+    args = sys.argv[1:]
+    runs = int(args[args.index("--runs") + 1]) if "--runs" in args else DEFAULT_RUNS
+    base = args[args.index("--dir") + 1] if "--dir" in args else None
+
+    if base:
+        os.makedirs(base, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix="fast-edit-durability-", dir=base)
+    try:
+        report = {mode: bench_mode(workdir, mode, runs) for mode in DURABILITY_MODES}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps({"runs": runs, "lines": LINES, "modes": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Scaling of save-pasted's content extraction (pasted._extract_pasted_content)
+on pathological pastes: one big minified JSON document, many small
+one-line objects, pretty-printed JSON and an XML document.
+
+Usage:
+    python3 bench/extract.py [--sizes MB[,MB...]] [--runs N]
+
+Each shape is generated at every size (default 1,10,100 MB). Time per MB
+should stay flat as the size grows. Output: JSON report on stdout.
+"""
+import os
+import sys
+import json
+import time
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pasted
+
+DEFAULT_SIZES = (1, 10, 100)
+DEFAULT_RUNS = 3
+MB = 1 << 20
+
+
+def _repeat(unit, size, head="", tail="", sep=""):
+    count = max(1, (size - len(head) - len(tail)) // (len(unit) + len(sep)))
+    return head + sep.join([unit] * count) + tail
+
+
+def make_paste(shape, size):
+    if shape == "minified_json":
+        unit = json.dumps({"id": 12345, "name": "item \"quoted\" \\ path", "tags": ["a", "b"],
+                           "nested": {"ok": True, "v": [1, 2, {"x": None}]}}, separators=(",", ":"))
+        return _repeat(unit, size, "Here is the data:\n[", "]", ",")
+    if shape == "small_objects":
+        unit = '{"event": "click", "x": 10, "y": 20}'
+        return _repeat(unit, size, sep="\n")
+    if shape == "pretty_json":
+        unit = json.dumps({"id": 1, "name": "item", "values": [1, 2, 3]}, indent=2).replace("\n", "\n  ")
+        return _repeat("  " + unit, size, "{\n \"items\": [\n", "\n ]\n}\n", ",\n")
+    if shape == "xml":
+        unit = '  <item id="1"><name>item &amp; more</name><value>42</value></item>'
+        return _repeat(unit, size, "<root>\n", "\n</root>\n", "\n")
+    raise ValueError(shape)
+
+
+SHAPES = ("minified_json", "small_objects", "pretty_json", "xml")
+
+
+def _median_ms(fn, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    args = sys.argv[1:]
+    runs = int(args[args.index("--runs") + 1]) if "--runs" in args else DEFAULT_RUNS
+    sizes = DEFAULT_SIZES
+    if "--sizes" in args:
+        sizes = [float(s) for s in args[args.index("--sizes") + 1].split(",")]
+
+    report = {}
+    for shape in SHAPES:
+        rows = []
+        for size_mb in sizes:
+            text = make_paste(shape, int(size_mb * MB))
+            extracted = pasted._extract_pasted_content(text)
+            ms = _median_ms(lambda text=text: pasted._extract_pasted_content(text), runs)
+            rows.append({
+                "mb": size_mb,
+                "ms": round(ms, 1),
+                "ms_per_mb": round(ms / (len(text) / MB), 2),
+                "extracted_fraction": round(len(extracted) / len(text), 3),
+            })
+            del text, extracted
+        report[shape] = rows
+    print(json.dumps({"runs": runs, "shapes": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
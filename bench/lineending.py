@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Line-ending handling on multi-megabyte CRLF content: normalizing new text
+(lineending.normalize against the per-line loop it replaced) and detecting
+a file's style (sampled and cached file_style against a full streamed
+CRLF count).
+
+Usage:
+    python3 bench/lineending.py [--sizes MB[,MB...]] [--runs N] [--dir DIR]
+
+Each size (default 1,10,50 MB) is tested with text that is already CRLF,
+text in LF that must become CRLF, and text with mixed endings. Output:
+JSON report on stdout with milliseconds per case and the speedup.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lineending
+
+DEFAULT_SIZES = (1, 10, 50)
+DEFAULT_RUNS = 3
+MB = 1 << 20
+CHUNK_SIZE = 1 << 20
+LINE = "    value = compute(item, factor=2)  # a typical source line"
+
+
+def old_normalize(content, line_ending):
+    """The previous per-line normalization, kept here as the baseline."""
+    if not content:
+        return ""
+    result = []
+    for line in content.splitlines(True):
+        stripped = line.rstrip("\r\n")
+        result.append(stripped + line_ending)
+    return "".join(result)
+
+
+def old_detect(path, total):
+    """The previous detection: CRLF count over the whole file, streamed."""
+    with open(path, "rb") as f:
+        crlf_count = 0
+        prev = b""
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            crlf_count += chunk.count(b"\r\n")
+            if prev.endswith(b"\r") and chunk.startswith(b"\n"):
+                crlf_count += 1
+            prev = chunk
+    return "\r\n" if crlf_count > total // 2 else "\n"
+
+
+def make_text(shape, size):
+    count = max(1, size // (len(LINE) + 2))
+    if shape == "crlf":
+        return (LINE + "\r\n") * count
+    if shape == "lf":
+        return (LINE + "\n") * count
+    if shape == "mixed":
+        return (LINE + "\r\n" + LINE + "\n" + LINE + "\r") * (count // 3 or 1)
+    raise ValueError(shape)
+
+
+SHAPES = ("crlf", "lf", "mixed")
+
+
+def _median_ms(fn, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def _row(old_ms, new_ms, **extra):
+    return {**extra, "old_ms": round(old_ms, 2), "new_ms": round(new_ms, 3),
+            "speedup": round(old_ms / new_ms, 1) if new_ms else None}
+
+
+def main():
+    args = sys.argv[1:]
+    runs = int(args[args.index("--runs") + 1]) if "--runs" in args else DEFAULT_RUNS
+    sizes = DEFAULT_SIZES
+    if "--sizes" in args:
+        sizes = [float(s) for s in args[args.index("--sizes") + 1].split(",")]
+    base = args[args.index("--dir") + 1] if "--dir" in args else None
+    if base:
+        os.makedirs(base, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix="fast-edit-lineending-", dir=base)
+
+    normalize_rows = []
+    detect_rows = []
+    try:
+        for size_mb in sizes:
+            size = int(size_mb * MB)
+            for shape in SHAPES:
+                text = make_text(shape, size)
+                if lineending.normalize(text, "\r\n") != old_normalize(text, "\r\n"):
+                    raise SystemExit(f"normalize differs from the old loop on {shape}")
+                normalize_rows.append(_row(
+                    _median_ms(lambda text=text: old_normalize(text, "\r\n"), runs),
+                    _median_ms(lambda text=text: lineending.normalize(text, "\r\n"), runs),
+                    mb=size_mb, shape=shape,
+                ))
+                del text
+
+            path = os.path.join(workdir, f"crlf-{size_mb}.txt")
+            data = make_text("crlf", size).encode()
+            with open(path, "wb") as f:
+                f.write(data)
+            total = data.count(b"\n")
+            del data
+            if lineending.file_style(path)[0] != old_detect(path, total):
+                raise SystemExit("file_style differs from the full scan")
+
+            def cold():
+                lineending._cache.clear()
+                lineending.file_style(path)
+
+            detect_rows.append(_row(
+                _median_ms(lambda: old_detect(path, total), runs),
+                _median_ms(cold, runs),
+                mb=size_mb, cached_ms=round(_median_ms(lambda: lineending.file_style(path), runs), 3),
+            ))
+            os.unlink(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"runs": runs, "normalize_to_crlf": normalize_rows,
+                      "detect": detect_rows}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Cold-start budget check for fast_edit.py.
+
+Runs `show` and `replace` in fresh interpreters and fails (exit 1) when
+either one imports a module outside its allowance or when its median
+startup overhead over a bare `python3 -c pass` exceeds the budget.
+
+Usage:
+    python3 bench/startup.py [--runs N] [--budget-ms MS]
+
+Output: JSON report on stdout.
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAST_EDIT = os.path.join(ROOT, "fast_edit.py")
+
+# Measure startup with cached bytecode, as in normal use
+ENV = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+
+DEFAULT_RUNS = 15
+DEFAULT_BUDGET_MS = 40.0
+
+# Modules a command must not pull in at startup
+FORBIDDEN = {
+    "show": {"subprocess", "base64", "pathlib", "tempfile", "shutil"},
+    "replace": {"subprocess", "base64", "pathlib"},
+}
+
+
+def _time_runs(cmd, runs):
+    subprocess.run(cmd, capture_output=True, check=True, env=ENV)  # warm-up
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, capture_output=True, check=True, env=ENV)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def _imported_modules(args):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", FAST_EDIT] + args,
+        capture_output=True, text=True, check=True, env=ENV
+    )
+    modules = set()
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:"):
+            modules.add(line.rsplit("|", 1)[-1].strip())
+    return modules
+
+
+def main():
+    args = sys.argv[1:]
+    runs = int(args[args.index("--runs") + 1]) if "--runs" in args else DEFAULT_RUNS
+    budget_ms = (float(args[args.index("--budget-ms") + 1])
+                 if "--budget-ms" in args else DEFAULT_BUDGET_MS)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        target = os.path.join(tmp, "sample.py")
+        with open(target, "w") as f:
+            f.writelines(f"line {i}\n" for i in range(1, 201))
+
+        commands = {
+            "show": ["show", target, "1", "40"],
+            "replace": ["replace", target, "10", "10", "line 10\\n"],
+        }
+
+        baseline_ms = _time_runs([sys.executable, "-c", "pass"], runs)
+        report = {"baseline_ms": round(baseline_ms, 3), "budget_ms": budget_ms,
+                  "commands": {}}
+        failed = False
+
+        for name, cmd_args in commands.items():
+            median_ms = _time_runs([sys.executable, FAST_EDIT] + cmd_args, runs)
+            overhead_ms = median_ms - baseline_ms
+            leaked = sorted(_imported_modules(cmd_args) & FORBIDDEN[name])
+            ok = overhead_ms <= budget_ms and not leaked
+            failed = failed or not ok
+            report["commands"][name] = {
+                "median_ms": round(median_ms, 3),
+                "overhead_ms": round(overhead_ms, 3),
+                "forbidden_imports": leaked,
+                "ok": ok,
+            }
+
+    report["status"] = "error" if failed else "ok"
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: every command over synthetic files of 1k to 1M lines.
+
+Each file size is generated with LF and with CRLF line endings, and each
+case runs fast_edit.py in a fresh process, as an agent would:
+
+    show                   40 lines from the middle
+    replace/insert/delete  one line in the middle
+    batch_N                N replace-lines edits spread over the file (1..1000)
+    write                  WRITE_FILES files together holding the file's lines
+    paste, paste_base64, paste_extract
+                           the file piped to paste --stdin, as is, base64
+                           encoded, or inside a fenced code block
+    save_pasted            the file as the newest paste in a synthetic OpenCode
+                           storage tree with some history
+
+Edited files are restored before every run (outside the timing), so edits
+see a cold line index. HOME and XDG_STATE_HOME point into the work
+directory, so no real journal, index or storage is touched.
+
+Usage:
+    python3 bench/suite.py [--sizes N[,N...]] [--runs N] [--only CASE[,CASE...]]
+                           [--save PATH] [--baseline PATH] [--tolerance PCT]
+                           [--extras] [--dir PATH]
+
+--save stores the report as a baseline. --baseline compares against one
+and exits 1 if a case got slower (or, for peak RSS, bigger) than
+--tolerance percent (default 25) and by more than the noise floor.
+--extras also runs bench/startup.py, durability.py, extract.py and
+lineending.py and includes their reports.
+Output: JSON report on stdout.
+"""
+import os
+import sys
+import json
+import shutil
+import base64
+import platform
+import tempfile
+import statistics
+import subprocess
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+FAST_EDIT = os.path.join(ROOT, "fast_edit.py")
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+DEFAULT_RUNS = 5
+DEFAULT_TOLERANCE = 25.0
+BATCH_EDITS = (1, 10, 100, 1000)
+WRITE_FILES = 100
+# Differences below these are noise from process startup and page cache
+NOISE_MS = 5.0
+NOISE_RSS_MB = 4.0
+# Synthetic OpenCode history around the paste
+HISTORY_SESSIONS = 20
+HISTORY_MESSAGES = 20
+MB = 1 << 20
+
+# Runs a command and records its wall time and peak RSS. Linux carries the
+# RSS high-water mark of a process across exec, so a command spawned
+# straight from this (large) process would report this process's peak. The
+# launcher is a bare interpreter, so the command inherits only its small one.
+LAUNCHER = """
+import os, sys, json, time
+t0 = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    os.execv(sys.argv[2], sys.argv[2:])
+_, status, usage = os.wait4(pid, 0)
+wall_ms = (time.perf_counter() - t0) * 1000
+with open(sys.argv[1], "w") as f:
+    json.dump({"wall_ms": wall_ms, "maxrss": usage.ru_maxrss}, f)
+sys.exit(os.waitstatus_to_exitcode(status))
+"""
+
+CASES = ("show", "replace", "insert", "delete",
+         *(f"batch_{n}" for n in BATCH_EDITS),
+         "write", "paste", "paste_base64", "paste_extract", "save_pasted")
+EXTRAS = {
+    "startup": ["--runs", "5"],
+    "durability": ["--runs", "5"],
+    "extract": ["--sizes", "1,10", "--runs", "1"],
+    "lineending": ["--sizes", "1,10", "--runs", "3"],
+}
+
+
+def make_lines(count):
+    return [f"    value_{i} = compute({i}, 'row {i % 97}')  # item {i}\n" for i in range(count)]
+
+
+def write_text(path, lines, eol):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline=eol) as f:
+        f.writelines(lines)
+
+
+def make_storage(home, text):
+    """OpenCode storage under home with some history; text is the newest paste."""
+    storage = os.path.join(home, ".local", "share", "opencode", "storage")
+    shutil.rmtree(storage, ignore_errors=True)
+    created = 1_700_000_000_000
+    for s in range(HISTORY_SESSIONS):
+        session_dir = os.path.join(storage, "message", f"ses_{s:04d}")
+        os.makedirs(session_dir)
+        for m in range(HISTORY_MESSAGES):
+            created += 1000
+            msg_id = f"msg_{s:04d}_{m:03d}"
+            role = "user" if m % 2 == 0 else "assistant"
+            last = s == HISTORY_SESSIONS - 1 and m == HISTORY_MESSAGES - 2
+            with open(os.path.join(session_dir, f"{msg_id}.json"), "w") as f:
+                json.dump({"id": msg_id, "role": role, "time": {"created": created}}, f)
+            part_dir = os.path.join(storage, "part", msg_id)
+            os.makedirs(part_dir)
+            body = text if last else "\n".join(f"note {i} in {msg_id}" for i in range(m % 7 * 5))
+            with open(os.path.join(part_dir, "prt_0.json"), "w") as f:
+                json.dump({"id": f"prt_{msg_id}", "type": "text", "text": body,
+                           "time": {"start": created}}, f)
+
+
+def run_once(args, env, stdin_path=None, setup=None):
+    """Run fast_edit.py once: (wall ms, peak RSS MB) of that process alone."""
+    if setup is not None:
+        setup()
+    with tempfile.NamedTemporaryFile("r") as stats, \
+            open(stdin_path or os.devnull, "rb") as stdin:
+        proc = subprocess.run(
+            [sys.executable, "-c", LAUNCHER, stats.name, sys.executable, FAST_EDIT] + args,
+            stdin=stdin, capture_output=True, env=env,
+        )
+        measured = json.load(stats)
+    output = proc.stdout.decode("utf-8", "replace")
+    try:
+        result = json.loads(output)
+    except ValueError:
+        result = None
+    if proc.returncode != 0 or not isinstance(result, dict) or result.get("status") != "ok":
+        message = (output + proc.stderr.decode("utf-8", "replace")).strip()
+        raise RuntimeError(f"{' '.join(args[:2])}: {message[:500]}")
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return measured["wall_ms"], measured["maxrss"] * scale / MB
+
+
+def measure(args, env, runs, nbytes, stdin_path=None, setup=None, edits=None):
+    run_once(args, env, stdin_path, setup)  # warm-up (page cache, bytecode, index)
+    samples = [run_once(args, env, stdin_path, setup) for _ in range(runs)]
+    wall = statistics.median(ms for ms, _ in samples)
+    row = {
+        "wall_ms": round(wall, 3),
+        "min_ms": round(min(ms for ms, _ in samples), 3),
+        "peak_rss_mb": round(max(rss for _, rss in samples), 2),
+        "bytes": nbytes,
+        "mb_per_sec": round(nbytes / MB / (wall / 1000), 2),
+    }
+    if edits:
+        row["edits_per_sec"] = round(edits / (wall / 1000), 1)
+    return row
+
+
+def bench_file(workdir, lines, eol, runs, only, env):
+    """All cases for one file size and line ending: {case: row}."""
+    count = len(lines)
+    name = "crlf" if eol == "\r\n" else "lf"
+    base = os.path.join(workdir, f"{name}-{count}")
+    pristine = os.path.join(base, "pristine.txt")
+    target = os.path.join(base, "target.txt")
+    write_text(pristine, lines, eol)
+    size = os.path.getsize(pristine)
+    shutil.copyfile(pristine, target)
+
+    def restore():
+        shutil.copyfile(pristine, target)
+
+    mid = str(count // 2 or 1)
+    cases = {
+        "show": lambda: measure(["show", target, mid, str(min(count, int(mid) + 39))],
+                                env, runs, size),
+        "replace": lambda: measure(["replace", target, mid, mid, "changed = 1\\n"],
+                                   env, runs, size, setup=restore),
+        "insert": lambda: measure(["insert", target, mid, "inserted = 1\\n"],
+                                  env, runs, size, setup=restore),
+        "delete": lambda: measure(["delete", target, mid, mid], env, runs, size, setup=restore),
+    }
+
+    for n in BATCH_EDITS:
+        def batch(n=n):
+            step = count // n
+            if step < 1:
+                return None
+            spec_path = os.path.join(base, f"batch-{n}.json")
+            with open(spec_path, "w") as f:
+                json.dump({"file": target, "edits": [
+                    {"action": "replace-lines", "start": i * step + 1, "end": i * step + 1,
+                     "content": f"edited_{i} = {i}\n"}
+                    for i in range(n)
+                ]}, f)
+            return measure(["batch", spec_path], env, runs, size, setup=restore, edits=n)
+        cases[f"batch_{n}"] = batch
+
+    def write():
+        per_file = max(1, count // WRITE_FILES)
+        spec_path = os.path.join(base, "write.json")
+        with open(spec_path, "w") as f:
+            json.dump({"files": [
+                {"file": os.path.join(base, "write", f"f{i:03d}.py"),
+                 "content": eol.join(l.rstrip("\n") for l in lines[i * per_file:(i + 1) * per_file]) + eol}
+                for i in range(min(WRITE_FILES, count))
+            ]}, f)
+        return measure(["write", spec_path], env, runs, size)
+    cases["write"] = write
+
+    out = os.path.join(base, "pasted.txt")
+
+    def paste(flags, transform=None):
+        stdin_path = pristine
+        if transform is not None:
+            stdin_path = os.path.join(base, "stdin.txt")
+            with open(pristine, "rb") as src, open(stdin_path, "wb") as dst:
+                dst.write(transform(src.read()))
+        return measure(["paste", out, "--stdin", *flags], env, runs, size, stdin_path)
+    cases["paste"] = lambda: paste([])
+    cases["paste_base64"] = lambda: paste(["--base64"], base64.b64encode)
+    cases["paste_extract"] = lambda: paste(
+        ["--extract"], lambda data: b"Here it is:\n```python\n" + data + b"```\nDone.\n")
+
+    def save_pasted():
+        with open(pristine, encoding="utf-8", newline="") as f:
+            make_storage(env["HOME"], f.read())
+        return measure(["save-pasted", out], env, runs, size)
+    cases["save_pasted"] = save_pasted
+
+    report = {}
+    for case, fn in cases.items():
+        if only and case not in only:
+            continue
+        row = fn()
+        if row is not None:
+            report[f"{case}/{name}/{count}"] = row
+    shutil.rmtree(base, ignore_errors=True)
+    return report
+
+
+def run_extras():
+    """Reports of the standalone benchmarks in this directory."""
+    extras = {}
+    for name, args in EXTRAS.items():
+        proc = subprocess.run([sys.executable, os.path.join(BENCH, f"{name}.py"), *args],
+                              capture_output=True, text=True)
+        try:
+            extras[name] = json.loads(proc.stdout)
+        except ValueError:
+            extras[name] = {"status": "error", "message": proc.stderr.strip()[-500:]}
+        if proc.returncode != 0:
+            extras[name]["status"] = "error"
+    return extras
+
+
+def compare(cases, baseline, tolerance):
+    """Per-case ratios against baseline["cases"]; flags regressions."""
+    factor = 1 + tolerance / 100
+    comparison = {}
+    for key, row in cases.items():
+        old = baseline.get("cases", {}).get(key)
+        if old is None:
+            continue
+        slower = (row["wall_ms"] > old["wall_ms"] * factor
+                  and row["wall_ms"] - old["wall_ms"] > NOISE_MS)
+        bigger = (row["peak_rss_mb"] > old["peak_rss_mb"] * factor
+                  and row["peak_rss_mb"] - old["peak_rss_mb"] > NOISE_RSS_MB)
+        comparison[key] = {
+            "wall_ratio": round(row["wall_ms"] / old["wall_ms"], 3) if old["wall_ms"] else None,
+            "rss_ratio": round(row["peak_rss_mb"] / old["peak_rss_mb"], 3)
+            if old["peak_rss_mb"] else None,
+            "regressed": slower or bigger,
+        }
+    return comparison
+
+
+def get_arg(args, flag, default=None):
+    return args[args.index(flag) + 1] if flag in args else default
+
+
+def main():
+    args = sys.argv[1:]
+    runs = int(get_arg(args, "--runs", DEFAULT_RUNS))
+    sizes = [int(s) for s in get_arg(args, "--sizes", "").split(",") if s] or DEFAULT_SIZES
+    only = set(get_arg(args, "--only", "").split(",")) - {""}
+    unknown = only - set(CASES)
+    if unknown:
+        sys.exit(f"unknown case(s): {', '.join(sorted(unknown))} (cases: {', '.join(CASES)})")
+    tolerance = float(get_arg(args, "--tolerance", DEFAULT_TOLERANCE))
+
+    base = get_arg(args, "--dir")
+    if base:
+        os.makedirs(base, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix="fast-edit-bench-", dir=base)
+    env = dict(os.environ, HOME=workdir, XDG_STATE_HOME=os.path.join(workdir, "state"))
+    for var in ("FAST_EDIT_JOURNAL_DIR", "FAST_EDIT_INDEX_DIR", "PYTHONDONTWRITEBYTECODE"):
+        env.pop(var, None)
+    cases = {}
+    try:
+        for count in sizes:
+            lines = make_lines(count)
+            for eol in ("\n", "\r\n"):
+                cases.update(bench_file(workdir, lines, eol, runs, only, env))
+            del lines
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": runs,
+        "sizes": sizes,
+        "cases": cases,
+    }
+    failed = False
+    if "--extras" in args:
+        report["extras"] = run_extras()
+        failed = any(r.get("status") == "error" for r in report["extras"].values())
+    baseline_path = get_arg(args, "--baseline")
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        report["tolerance_pct"] = tolerance
+        report["comparison"] = compare(cases, baseline, tolerance)
+        report["regressions"] = sorted(k for k, c in report["comparison"].items() if c["regressed"])
+        failed = failed or bool(report["regressions"])
+    report["status"] = "error" if failed else "ok"
+
+    save_path = get_arg(args, "--save")
+    if save_path:
+        with open(save_path, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
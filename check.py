@@ -1,11 +1,33 @@
 """
 Type checking for Python files.
 Auto-detects available checker: basedpyright > pyright > mypy
+
+Checks reuse a warm session per project root when one is available (see
+sessions.py): dmypy for mypy, a language server for the pyright family
+when running inside the daemon. Otherwise the checker runs cold.
+
+Before any checker is started, files are parsed in-process (see syntax.py):
+if one has a syntax error, that is reported at once and no checker runs.
+
+Checker discovery and diagnostics are cached on disk (under
+$XDG_STATE_HOME/fast-edit/): discovery is redone when PATH or a checker
+executable changes, and diagnostics are reused while the checker, its
+version, the project's config files and the file's content are unchanged.
 """
 import os
+import json
+import time
+import shutil
 import subprocess
 import re
 
+import sessions
+import settings
+import syntax
+from core import state_dir, write_file
+
+
+TIMEOUT = 60
 
 CHECKERS = [
     ("basedpyright", ["basedpyright", "--version"]),
@@ -14,34 +36,174 @@ CHECKERS = [
 ]
 
 
+# Project files whose contents change what a checker reports
+CONFIG_FILES = ("pyproject.toml", "setup.cfg", "mypy.ini", ".mypy.ini", "pyrightconfig.json")
+CACHE_ENV = "FAST_EDIT_CHECK_CACHE"
+MAX_CACHED = 512
+
+
+def _load_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_json(path, data):
+    try:
+        write_file(path, json.dumps(data), durability="none")
+    except OSError:
+        pass  # caches are only an optimization
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _path_state():
+    """PATH and the mtime of each of its directories (they change when a checker is installed)."""
+    search = os.environ.get("PATH") or ""
+    return {"PATH": search, "dirs": [_mtime_ns(d or ".") for d in search.split(os.pathsep)]}
+
+
+def discover():
+    """
+    {name: {"exe", "mtime_ns", "version"}} for every installed checker,
+    resolved with shutil.which and cached on disk until PATH, one of its
+    directories or one of the executables changes. Versions are filled in
+    lazily by checker_version.
+    """
+    path = os.path.join(state_dir("checkers"), "discovery.json")
+    cached = _load_json(path)
+    state = _path_state()
+    if cached and all(cached.get(key) == value for key, value in state.items()) and all(
+        _mtime_ns(entry["exe"]) == entry["mtime_ns"] for entry in cached["checkers"].values()
+    ):
+        return cached["checkers"]
+    
+    found = {}
+    for name, _ in CHECKERS:
+        exe = shutil.which(name)
+        if exe:
+            found[name] = {"exe": exe, "mtime_ns": _mtime_ns(exe), "version": None}
+    _save_json(path, dict(state, checkers=found))
+    return found
+
+
+def checker_version(name):
+    """Version string of an installed checker (run once per executable change)."""
+    found = discover()
+    entry = found.get(name)
+    if entry is None:
+        return None
+    if entry["version"] is None:
+        version_cmd = dict(CHECKERS)[name]
+        result = subprocess.run([entry["exe"], *version_cmd[1:]], capture_output=True,
+                                text=True, timeout=30)
+        entry["version"] = (result.stdout or result.stderr).strip()
+        _save_json(os.path.join(state_dir("checkers"), "discovery.json"),
+                   dict(_path_state(), checkers=found))
+    return entry["version"]
+
+
 def find_checker():
     """Find first available type checker."""
-    for name, version_cmd in CHECKERS:
-        try:
-            subprocess.run(version_cmd, capture_output=True, timeout=5)
+    found = discover()
+    for name, _ in CHECKERS:
+        if name in found:
             return name
-        except Exception:
-            continue
     return None
 
 
-def parse_output(output, filepath):
-    """Parse checker output into structured diagnostics."""
-    diagnostics = []
-    basename = os.path.basename(filepath)
+def cache_key(checker, abs_path):
+    """
+    Diagnostics cache key: checker, its version, the project's config files
+    and the file's content. Returns None if the checker is not installed.
+    """
+    import hashlib
     
-    for line in output.split("\n"):
-        # Skip lines not about our file
-        if filepath not in line and basename not in line:
+    version = checker_version(checker)
+    if version is None:
+        return None
+    h = hashlib.sha256()
+    h.update(f"{checker}\0{version}\0".encode("utf-8"))
+    root = sessions.project_root(abs_path)
+    for name in CONFIG_FILES:
+        try:
+            with open(os.path.join(root, name), "rb") as f:
+                h.update(name.encode("utf-8") + b"\0" + hashlib.sha256(f.read()).digest())
+        except OSError:
             continue
-        
-        # Extract line:col from output
-        match = re.search(r":(\d+):(\d+)?", line)
+    with open(abs_path, "rb") as f:
+        h.update(b"\0" + hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def _cache_path(key):
+    return os.path.join(state_dir("check-cache"), key + ".json")
+
+
+def cache_get(key):
+    """Cached diagnostics for key (refreshing its LRU position), or None."""
+    path = _cache_path(key)
+    diagnostics = _load_json(path)
+    if diagnostics is not None:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    return diagnostics
+
+
+def cache_put(key, diagnostics):
+    """Store diagnostics, evicting the least recently used entries beyond MAX_CACHED."""
+    path = _cache_path(key)
+    _save_json(path, diagnostics)
+    directory = os.path.dirname(path)
+    try:
+        entries = [e for e in os.scandir(directory) if e.name.endswith(".json")]
+    except OSError:
+        return
+    if len(entries) > MAX_CACHED:
+        entries.sort(key=lambda e: e.stat().st_mtime_ns)
+        for entry in entries[:len(entries) - MAX_CACHED]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def cache_enabled():
+    return settings.get(CACHE_ENV, "").lower() not in ("0", "off", "false", "no")
+
+
+# "path:line:" or "path:line:col" at the start of a checker output line
+_LOCATION = re.compile(r"^\s*(.+?):(\d+):(?:(\d+)\b)?")
+
+
+def split_output(output, filepaths, cwd):
+    """
+    Parse human-readable checker output into structured diagnostics per
+    file: {abs path: [diagnostic, ...]} for each of filepaths. Lines are
+    attributed by the path they start with (resolved against cwd). Only
+    used when a checker has no machine-readable output.
+    """
+    by_path = {os.path.abspath(p): [] for p in filepaths}
+    
+    for line in output.split("\n"):
+        match = _LOCATION.match(line)
         if not match:
             continue
+        path = os.path.normpath(os.path.join(cwd, match.group(1)))
+        if path not in by_path:
+            continue
         
-        line_num = int(match.group(1))
-        col = int(match.group(2)) if match.group(2) else 1
+        line_num = int(match.group(2))
+        col = int(match.group(3)) if match.group(3) else 1
         
         # Determine severity
         severity = "error" if "error" in line.lower() else "warning"
@@ -52,26 +214,345 @@ def parse_output(output, filepath):
         else:
             message = line.split(": ", 1)[-1]
         
-        diagnostics.append({
+        by_path[path].append({
             "line": line_num,
             "col": col,
             "severity": severity,
             "message": message.strip()
         })
     
-    return diagnostics
+    return by_path
+
+
+def parse_output(output, filepath):
+    """Parse checker output into structured diagnostics for one file."""
+    abs_path = os.path.abspath(filepath)
+    return split_output(output, [abs_path], os.path.dirname(abs_path))[abs_path]
+
+
+def _diagnostic(line, col, severity, message, rule=None):
+    diagnostic = {
+        "line": line,
+        "col": col,
+        "severity": "error" if severity == "error" else "warning",
+        "message": message.strip()
+    }
+    if rule:
+        diagnostic["rule"] = rule
+    return diagnostic
+
+
+def lsp_diagnostic(diagnostic):
+    """Convert an LSP diagnostic to the check output format."""
+    start = diagnostic["range"]["start"]
+    severity = "error" if diagnostic.get("severity", 1) == 1 else "warning"
+    return _diagnostic(start["line"] + 1, start["character"] + 1, severity,
+                       diagnostic["message"], diagnostic.get("code"))
+
+
+def parse_pyright_json(output, filepaths):
+    """Diagnostics per file from pyright/basedpyright --outputjson."""
+    by_path = {os.path.abspath(p): [] for p in filepaths}
+    for d in json.loads(output).get("generalDiagnostics", []):
+        path = os.path.normpath(d["file"])
+        if path not in by_path:
+            continue
+        start = d.get("range", {}).get("start", {"line": 0, "character": 0})
+        by_path[path].append(_diagnostic(
+            start["line"] + 1, start["character"] + 1, d["severity"], d["message"], d.get("rule")
+        ))
+    return by_path
+
+
+def parse_mypy_json(output, filepaths, cwd):
+    """Diagnostics per file from mypy -O json (one JSON object per line)."""
+    by_path = {os.path.abspath(p): [] for p in filepaths}
+    for line in output.splitlines():
+        if not line.startswith("{"):
+            continue  # e.g. "Daemon started"
+        d = json.loads(line)
+        path = os.path.normpath(os.path.join(cwd, d["file"]))
+        if path not in by_path:
+            continue
+        message = d["message"]
+        if d.get("hint"):
+            message += "\n" + d["hint"]
+        by_path[path].append(_diagnostic(
+            d["line"], max(d.get("column", 0), 0) + 1, d["severity"], message, d.get("code")
+        ))
+    return by_path
+
+
+# mypy older than 1.11 has no -O json; its usage error mentions the flag
+_MYPY_JSON = ["-O", "json", "--no-error-summary"]
+
 
+def _mypy_unsupported(output):
+    return "unrecognized arguments" in output or "invalid choice" in output
 
-def check(filepath, checker=None):
+
+def run_checker(checker, abs_paths, cold=False):
+    """
+    Run checker on files in one invocation per project root, warm when
+    possible, reading its machine-readable output (mypy -O json, pyright
+    --outputjson, LSP diagnostics). Returns ({abs path: diagnostics}, warm).
+    Raises subprocess.TimeoutExpired / TimeoutError after TIMEOUT seconds.
+    """
+    roots = {}
+    for path in abs_paths:
+        roots.setdefault(sessions.project_root(path), []).append(path)
+    
+    found = {}
+    warm = True
+    for root, paths in roots.items():
+        if not cold and checker == "mypy" and shutil.which("dmypy"):
+            output, root_warm = sessions.dmypy_run(root, paths, _MYPY_JSON, TIMEOUT)
+            if _mypy_unsupported(output):
+                output, root_warm = sessions.dmypy_run(root, paths, ["--no-error-summary"], TIMEOUT)
+                found.update(split_output(output, paths, root))
+            else:
+                found.update(parse_mypy_json(output, paths, root))
+            warm = warm and root_warm
+            continue
+        
+        session = None if cold else sessions.language_server(checker, root, TIMEOUT)
+        if session is not None:
+            server, root_warm = session
+            for path, diagnostics in server.diagnostics(paths, TIMEOUT).items():
+                found[path] = [lsp_diagnostic(d) for d in diagnostics]
+            warm = warm and root_warm
+            continue
+        
+        warm = False
+        if checker == "mypy":
+            output = _run([checker, *_MYPY_JSON, *paths], root)
+            if not _mypy_unsupported(output):
+                found.update(parse_mypy_json(output, paths, root))
+                continue
+            output = _run([checker, "--no-error-summary", *paths], root)
+        else:
+            result = subprocess.run([checker, "--outputjson", *paths], capture_output=True,
+                                    text=True, timeout=TIMEOUT, cwd=root)
+            try:
+                found.update(parse_pyright_json(result.stdout, paths))
+                continue
+            except ValueError:
+                output = result.stdout + result.stderr
+        # Text output: scrape it
+        found.update(split_output(output, paths, root))
+    
+    return found, warm and bool(roots)
+
+
+def _run(cmd, cwd):
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=TIMEOUT, cwd=cwd)
+    return result.stdout + result.stderr
+
+
+def _check_with(checker, abs_paths, cold, cache):
+    """One checker over all files, skipping files whose diagnostics are cached."""
+    use_cache = cache and cache_enabled()
+    keys = {}
+    found = {}
+    states = {}
+    for path in abs_paths:
+        key = cache_key(checker, path) if use_cache else None
+        cached = cache_get(key) if key else None
+        if cached is not None:
+            found[path] = cached
+            states[path] = "hit"
+        else:
+            keys[path] = key
+            states[path] = "miss" if key else "off"
+    
+    warm = False
+    if keys:
+        fresh, warm = run_checker(checker, list(keys), cold)
+        for path, key in keys.items():
+            found[path] = fresh.get(path, [])
+            if key:
+                cache_put(key, found[path])
+    
+    return {"checker": checker, "warm": warm, "diagnostics": found, "cache": states}
+
+
+def _run_safely(checker, abs_paths, cold, cache):
+    try:
+        return _check_with(checker, abs_paths, cold, cache)
+    except (subprocess.TimeoutExpired, TimeoutError):
+        return {"checker": checker, "error": f"Type checker timed out after {TIMEOUT}s"}
+    except Exception as e:
+        return {"checker": checker, "error": f"Failed to run checker: {e}"}
+
+
+def _syntax_entry(path, diagnostics):
+    return {"file": path, "errors": len(diagnostics), "warnings": 0, "diagnostics": diagnostics}
+
+
+def _syntax_result(base, abs_paths, found, t0):
+    """Result for files failing the syntax pre-check (no checker was run)."""
+    results = [_syntax_entry(path, found[path]) for path in abs_paths]
+    return dict(
+        base,
+        stage="syntax",
+        errors=sum(r["errors"] for r in results),
+        warnings=0,
+        results=results,
+        elapsed_ms=round((time.perf_counter() - t0) * 1000, 3),
+    )
+
+
+def _in_scope(diagnostic, ranges, context):
+    line = diagnostic["line"]
+    return any(start - context <= line <= end + context for start, end in ranges)
+
+
+def check_files(filepaths, checkers=None, cold=False, cache=True, precheck=True,
+                lines=None, since_edit=False, context=0):
+    """
+    Type check many files with one checker invocation (per project root),
+    splitting the diagnostics per file.
+    
+    Args:
+        filepaths: Paths to check (non-Python files are skipped)
+        checkers: Checker names (auto-detect if None). With several, they run
+            concurrently and each diagnostic is tagged with its "checker".
+        cold: Always start fresh checker processes
+        cache: Reuse cached diagnostics (see cache_key)
+        precheck: Parse files in-process first; files with syntax errors
+            report those (their entries carry "stage": "syntax") and only
+            the others go to the checker
+        lines: Only report diagnostics within these (start, end) line ranges
+        since_edit: Only report diagnostics within the ranges changed by each
+            file's latest journaled edit (see journal.last_edit_ranges)
+        context: Also report diagnostics this many lines around the ranges
+    
+    Returns:
+        Dict with status, checkers, per-file results, totals, the stage that
+        produced them ("syntax" or "checker") and elapsed_ms. Scoped results
+        carry their "scope" ranges and how many diagnostics were "hidden".
+    """
+    t0 = time.perf_counter()
+    abs_paths = []
+    skipped = []
+    for filepath in dict.fromkeys(os.path.abspath(p) for p in filepaths):
+        if not os.path.isfile(filepath):
+            raise FileNotFoundError(f"File not found: {filepath}")
+        if syntax.is_python(filepath):
+            abs_paths.append(filepath)
+        else:
+            skipped.append(filepath)
+    
+    base = {"status": "ok", "files": len(abs_paths)}
+    if skipped:
+        base["skipped"] = skipped
+    if not abs_paths:
+        return dict(base, message="No Python files to check")
+    
+    broken = {}
+    if precheck:
+        broken = {path: found for path, found in syntax.check_files(abs_paths).items() if found}
+        if len(broken) == len(abs_paths):
+            return _syntax_result(base, abs_paths, broken, t0)
+    parsed = [path for path in abs_paths if path not in broken]
+    
+    if not checkers:
+        found = find_checker()
+        checkers = [found] if found else []
+    if not checkers:
+        if broken:
+            return _syntax_result(base, list(broken), broken, t0)
+        return dict(base, message="No type checker found (install basedpyright, pyright, or mypy)")
+    
+    if len(checkers) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(checkers)) as pool:
+            env = settings.current()
+            
+            def run_one(checker):
+                with settings.using(env):
+                    return _run_safely(checker, parsed, cold, cache)
+            
+            runs = list(pool.map(run_one, checkers))
+    else:
+        runs = [_run_safely(checkers[0], parsed, cold, cache)]
+    
+    ok_runs = [run for run in runs if "error" not in run]
+    failed = {run["checker"]: run["error"] for run in runs if "error" in run}
+    if not ok_runs:
+        return {
+            "status": "error",
+            "checker": ", ".join(checkers),
+            "message": "; ".join(failed.values())
+        }
+    
+    results = []
+    for path in abs_paths:
+        if path in broken:
+            results.append(dict(_syntax_entry(path, broken[path]), stage="syntax"))
+            continue
+        diagnostics = []
+        for run in ok_runs:
+            for d in run["diagnostics"].get(path, []):
+                diagnostics.append(dict(d, checker=run["checker"]) if len(checkers) > 1 else d)
+        if len(ok_runs) > 1:
+            diagnostics.sort(key=lambda d: (d["line"], d["col"]))
+        
+        scope = lines
+        if since_edit:
+            import journal
+            scope = journal.last_edit_ranges(path)
+        hidden = 0
+        if scope is not None:
+            kept = [d for d in diagnostics if _in_scope(d, scope, context)]
+            hidden = len(diagnostics) - len(kept)
+            diagnostics = kept
+        
+        errors = sum(1 for d in diagnostics if d["severity"] == "error")
+        entry = {
+            "file": path,
+            "errors": errors,
+            "warnings": len(diagnostics) - errors,
+            "diagnostics": diagnostics,
+        }
+        if lines is not None or since_edit:
+            entry["scope"] = [list(r) for r in scope] if scope is not None else None
+            entry["hidden"] = hidden
+        if len(ok_runs) == 1:
+            entry["cache"] = ok_runs[0]["cache"][path]
+        results.append(entry)
+    
+    result = dict(
+        base,
+        stage="checker",
+        checker=checkers[0] if len(checkers) == 1 else checkers,
+        warm=all(run["warm"] for run in ok_runs),
+        errors=sum(r["errors"] for r in results),
+        warnings=sum(r["warnings"] for r in results),
+        results=results,
+    )
+    if failed:
+        result["failed"] = failed
+    result["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+    return result
+
+
+def check(filepath, checker=None, cold=False, cache=True, precheck=True,
+          lines=None, since_edit=False, context=0):
     """
     Run type checker on Python file.
     
     Args:
         filepath: Path to Python file
         checker: Specific checker to use (auto-detect if None)
+        cold: Always start a fresh checker process instead of a warm session
+        cache: Reuse diagnostics for identical content/config (see cache_key)
+        precheck: Report syntax errors without running the checker
+        lines / since_edit / context: Scope the diagnostics (see check_files)
     
     Returns:
-        Dict with status, checker used, error/warning counts, and diagnostics
+        Dict with status, checker used, error/warning counts, diagnostics,
+        whether a warm session answered, cache hit/miss, stage, and elapsed_ms
     """
     abs_path = os.path.abspath(filepath)
     
@@ -88,58 +569,26 @@ def check(filepath, checker=None):
             "message": f"Type checking not supported for {ext} files"
         }
     
-    # Find checker
-    if not checker:
-        checker = find_checker()
-    
-    if not checker:
-        return {
-            "status": "ok",
-            "file": abs_path,
-            "message": "No type checker found (install basedpyright, pyright, or mypy)"
-        }
-    
-    # Build command
-    if checker == "mypy":
-        cmd = [checker, "--no-error-summary", abs_path]
-    else:
-        cmd = [checker, abs_path]
-    
-    # Run checker
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=60,
-            cwd=os.path.dirname(abs_path) or "."
-        )
-        output = result.stdout + result.stderr
-    except subprocess.TimeoutExpired:
-        return {
-            "status": "error",
-            "file": abs_path,
-            "checker": checker,
-            "message": "Type checker timed out after 60s"
-        }
-    except Exception as e:
-        return {
-            "status": "error",
-            "file": abs_path,
-            "checker": checker,
-            "message": f"Failed to run checker: {e}"
-        }
-    
-    # Parse output
-    diagnostics = parse_output(output, filepath)
-    errors = sum(1 for d in diagnostics if d["severity"] == "error")
-    warnings = len(diagnostics) - errors
+    result = check_files([abs_path], [checker] if checker else None, cold, cache, precheck,
+                         lines, since_edit, context)
+    if "results" not in result:
+        result.pop("files", None)
+        return dict(result, file=abs_path)
     
-    return {
+    entry = result["results"][0]
+    single = {
         "status": "ok",
         "file": abs_path,
-        "checker": checker,
-        "errors": errors,
-        "warnings": warnings,
-        "diagnostics": diagnostics
+        "stage": result["stage"],
+        "checker": result.get("checker"),
+        "warm": result.get("warm", False),
+        "cache": entry.get("cache", "off"),
+        "errors": entry["errors"],
+        "warnings": entry["warnings"],
+        "diagnostics": entry["diagnostics"],
     }
+    for key in ("scope", "hidden"):
+        if key in entry:
+            single[key] = entry[key]
+    single["elapsed_ms"] = result["elapsed_ms"]
+    return single
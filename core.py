@@ -4,70 +4,592 @@ Provides atomic file operations with cross-platform support.
 """
 import sys
 import os
-import tempfile
-import shutil
+
+import settings
 
 
 def read_lines(filepath):
-    """Read file and return list of lines (preserving line endings)."""
+    """Read file and return list of lines (preserving line endings, split on LF)."""
     abs_path = os.path.abspath(filepath)
     with open(abs_path, "r", encoding="utf-8", newline="") as f:
-        return f.readlines()
+        return split_lines(f.read())
+
+
+CHUNK_SIZE = 1 << 16
+
+
+def count_lines(f):
+    """Count lines from the current position of a binary file to EOF, in chunks."""
+    count = 0
+    last = b""
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        count += chunk.count(b"\n")
+        last = chunk
+    if last and not last.endswith(b"\n"):
+        count += 1
+    return count
 
 
-def write_file(filepath, content):
+def split_lines(data):
     """
-    Atomic write: write to temp file, then rename.
-    Supports both string content and list of lines.
+    Split str or bytes on LF only, keeping endings.
+    Unlike splitlines(), lone CR (and form feeds etc.) are not line breaks,
+    so line numbers agree with the byte-offset index in lineindex.py.
+    """
+    nl = b"\n" if isinstance(data, bytes) else "\n"
+    parts = data.split(nl)
+    lines = [part + nl for part in parts[:-1]]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+
+def tail_lines(f, n):
     """
+    Return the last n lines of a binary file (as bytes, endings kept),
+    reading backward from EOF in chunks instead of scanning from the start.
+    """
+    if n <= 0:
+        return []
+    pos = f.seek(0, os.SEEK_END)
+    data = b""
+    while pos > 0:
+        step = min(CHUNK_SIZE, pos)
+        pos -= step
+        f.seek(pos)
+        data = f.read(step) + data
+        # Every LF except a trailing one starts a complete line after it
+        if data.count(b"\n", 0, len(data) - 1) >= n:
+            break
+    lines = split_lines(data)
+    if pos > 0:
+        lines = lines[1:]  # first piece may be a partial line
+    return lines[-n:]
+
+
+def state_dir(name):
+    """Per-user state directory for fast-edit data: $XDG_STATE_HOME/fast-edit/name."""
+    base = os.environ.get("XDG_STATE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".local", "state"
+    )
+    return os.path.join(base, "fast-edit", name)
+
+
+DURABILITY_ENV = "FAST_EDIT_DURABILITY"
+DURABILITY_MODES = ("none", "file", "file+dir")
+
+
+def durability_mode(mode=None):
+    """
+    Resolve a durability setting: explicit mode, else $FAST_EDIT_DURABILITY,
+    else "none".
+        none      rename only (fastest; a crash may lose recent edits)
+        file      fsync the temp file before the rename
+        file+dir  also fsync the parent directory after the rename
+    """
+    mode = mode or settings.get(DURABILITY_ENV) or "none"
+    if mode not in DURABILITY_MODES:
+        raise ValueError(
+            f"durability must be one of {', '.join(DURABILITY_MODES)}, got {mode!r}"
+        )
+    return mode
+
+
+def prepare_temp(filepath, fill, makedirs=True, durability=None):
+    """
+    First half of an atomic write: write a temp file next to filepath with
+    the target's permissions via fill(fd) (fill must not close fd), fsynced
+    unless durability is "none". Returns the temp path; nothing is visible
+    at filepath yet.
+    """
+    import stat
+    import tempfile
+
+    mode = durability_mode(durability)
     abs_path = os.path.abspath(filepath)
     dir_path = os.path.dirname(abs_path) or "."
     
     # Ensure directory exists
-    os.makedirs(dir_path, exist_ok=True)
+    if makedirs:
+        os.makedirs(dir_path, exist_ok=True)
     
     # Write to temp file first
     fd, tmp_path = tempfile.mkstemp(dir=dir_path)
     try:
-        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+        try:
+            # Preserve original file permissions if exists
+            try:
+                perms = stat.S_IMODE(os.stat(abs_path).st_mode)
+            except FileNotFoundError:
+                perms = None
+            if perms is not None:
+                if hasattr(os, "fchmod"):
+                    os.fchmod(fd, perms)
+                else:
+                    os.chmod(tmp_path, perms)
+            
+            fill(fd)
+            if mode != "none":
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+    except Exception:
+        discard_temp(tmp_path)
+        raise
+    return tmp_path
+
+
+def commit_temp(tmp_path, filepath, durability=None):
+    """
+    Second half of an atomic write: rename the temp file over filepath
+    (os.replace is atomic on POSIX and Windows), then fsync the directory
+    in "file+dir" mode.
+    """
+    abs_path = os.path.abspath(filepath)
+    try:
+        os.replace(tmp_path, abs_path)
+    except Exception:
+        discard_temp(tmp_path)
+        raise
+    if durability_mode(durability) == "file+dir":
+        fsync_dir(os.path.dirname(abs_path) or ".")
+
+
+def discard_temp(tmp_path):
+    """Remove a prepared temp file that will not be committed."""
+    try:
+        os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
+
+
+def atomic_write(filepath, fill, durability=None):
+    """
+    Atomic write: call fill(fd) to write a temp file, then rename it over
+    filepath. fill must not close fd.
+    """
+    tmp_path = prepare_temp(filepath, fill, durability=durability)
+    commit_temp(tmp_path, filepath, durability=durability)
+
+
+def commit_all(pairs, durability=None):
+    """
+    Commit several prepared (tmp_path, filepath) pairs as one unit.
+    Each existing target is hard-linked to a backup first. If any rename
+    fails, targets already replaced are restored (or removed if they were
+    new) and all remaining temp files are discarded. In "file+dir" mode each
+    parent directory is fsynced once, after all renames.
+    """
+    import shutil
+
+    done = []
+    backup = None
+    try:
+        for tmp_path, filepath in pairs:
+            abs_path = os.path.abspath(filepath)
+            backup = None
+            if os.path.exists(abs_path):
+                backup = tmp_path + ".bak"
+                try:
+                    os.link(abs_path, backup)
+                except OSError:
+                    shutil.copy2(abs_path, backup)
+            commit_temp(tmp_path, abs_path, durability="none")
+            done.append((abs_path, backup))
+            backup = None
+    except Exception:
+        for abs_path, saved in reversed(done):
+            if saved:
+                os.replace(saved, abs_path)
+            else:
+                os.remove(abs_path)
+        for tmp_path, _ in pairs:
+            discard_temp(tmp_path)
+        if backup:
+            discard_temp(backup)
+        raise
+    for _, saved in done:
+        if saved:
+            os.remove(saved)
+    if durability_mode(durability) == "file+dir":
+        for dir_path in {os.path.dirname(path) or "." for path, _ in done}:
+            fsync_dir(dir_path)
+
+
+def write_file(filepath, content, durability=None):
+    """
+    Atomic write: write to temp file, then rename.
+    Supports both string content and list of lines.
+    """
+    def fill(fd):
+        with open(fd, "w", encoding="utf-8", newline="", closefd=False) as f:
             if isinstance(content, list):
                 f.writelines(content)
             else:
                 f.write(content)
+    
+    atomic_write(filepath, fill, durability=durability)
+
+
+def fsync_dir(dir_path):
+    """Flush a directory entry (renames/creates) to disk; no-op where unsupported."""
+    if sys.platform == "win32":
+        return
+    fd = os.open(dir_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_files(files, workers=None, durability=None, skip_unchanged=False):
+    """
+    Write many (filepath, content) pairs as one group commit. content is a
+    string, a list of lines, or a content_ref() dict copied from disk.
+    
+    Parent directories are created once each, temp files are written (and
+    fsynced, per durability) concurrently by a bounded thread pool, then all
+    are renamed into place with commit_all, which fsyncs each parent
+    directory once rather than once per file. Nothing is written if any
+    file fails.
+    
+    With skip_unchanged, files whose content already matches are left
+    untouched. Returns one flag per file: True where it was skipped.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    durability = durability_mode(durability)
+    targets = [os.path.abspath(filepath) for filepath, _ in files]
+    for dir_path in {os.path.dirname(path) or "." for path in targets}:
+        os.makedirs(dir_path, exist_ok=True)
+    seen = set()
+    repeated = {path for path in targets if path in seen or seen.add(path)}
+    
+    def prepare(item):
+        path, content = item
+        if isinstance(content, dict):
+            segments = [(content["path"], content["begin"], content["end"])]
+        else:
+            data = ("".join(content) if isinstance(content, list) else content).encode("utf-8")
+            segments = [data]
+        # A path written twice ends with its last content, whatever is on disk now
+        if skip_unchanged and path not in repeated and unchanged(path, segments):
+            return None
         
-        # Preserve original file permissions if exists
-        if os.path.exists(abs_path):
-            os.chmod(tmp_path, os.stat(abs_path).st_mode)
+        def fill(fd):
+            if isinstance(content, dict):
+                with open(content["path"], "rb") as src:
+                    copy_range(src.fileno(), fd, content["begin"], content["end"] - content["begin"])
+                return
+            _write_all(fd, segments[0])
         
-        # Windows requires removing target first
-        if sys.platform == "win32" and os.path.exists(abs_path):
-            os.remove(abs_path)
+        return prepare_temp(path, fill, makedirs=False, durability=durability)
+    
+    temps = []
+    error = None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(prepare, item) for item in zip(targets, (c for _, c in files))]
+        for future in futures:
+            try:
+                temps.append(future.result())
+            except Exception as e:
+                error = error or e
+    if error is not None:
+        for tmp_path in temps:
+            if tmp_path is not None:
+                discard_temp(tmp_path)
+        raise error
+    
+    commit_all([(tmp, path) for tmp, path in zip(temps, targets) if tmp is not None],
+               durability=durability)
+    return [tmp is None for tmp in temps]
+
+
+def content_ref(entry):
+    """
+    Resolve an edit/write entry's content reference to a byte span of a file:
+        "content_file": PATH                      the whole file
+        "content_range": {"file": PATH, "start": N, "end": M}
+                                                  lines N..M (1-based, inclusive)
+        "content_range": {..., "unit": "bytes"}   bytes [N, M)
+    Returns {"path", "begin", "end", "index"} (index: the source's LineIndex
+    when known) or None if the entry has no reference.
+    """
+    if "content_file" in entry:
+        path = os.path.abspath(entry["content_file"])
+        return {"path": path, "begin": 0, "end": os.path.getsize(path), "index": None}
+    
+    ref = entry.get("content_range")
+    if ref is None:
+        return None
+    path = os.path.abspath(ref["file"])
+    start, end = ref["start"], ref["end"]
+    
+    if ref.get("unit", "lines") == "bytes":
+        size = os.path.getsize(path)
+        if not 0 <= start <= end <= size:
+            raise ValueError(f"content_range: bytes {start}..{end} outside {path} ({size} bytes)")
+        return {"path": path, "begin": start, "end": end, "index": None}
+    
+    import lineindex
+    index = lineindex.get_index(path)
+    validate_range(start, end, index.total, "content_range")
+    begin, stop = index.span(start, end)
+    return {"path": path, "begin": begin, "end": stop, "index": index}
+
+
+def read_ref(ref):
+    """Read a content_ref() span into memory."""
+    with open(ref["path"], "rb") as f:
+        f.seek(ref["begin"])
+        return f.read(ref["end"] - ref["begin"])
+
+
+def ref_ends_with_newline(ref):
+    """Whether a non-empty content_ref() span ends with LF."""
+    with open(ref["path"], "rb") as f:
+        f.seek(ref["end"] - 1)
+        return f.read(1) == b"\n"
+
+
+# Bytes that lineending.normalize would rewrite, per target line ending
+_NOT_NORMALIZED = {
+    "\n": rb"\r",
+    "\r\n": rb"(?<!\r)\n|\r(?!\n)",
+}
+
+
+def ref_is_normalized(ref, line_ending):
+    """
+    Whether a content_ref() span already uses line_ending throughout, so it
+    can be copied verbatim; scanned through mmap without decoding.
+    """
+    import re
+    import mmap
+
+    if ref["end"] <= ref["begin"]:
+        return True
+    pattern = re.compile(_NOT_NORMALIZED[line_ending])
+    with open(ref["path"], "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return pattern.search(mm, ref["begin"], ref["end"]) is None
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _copy_file_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset)
+
+
+def _sendfile(src_fd, dst_fd, offset, count):
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def _buffered_copy(src_fd, dst_fd, offset, count):
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    data = os.read(src_fd, min(count, CHUNK_SIZE * 16))
+    _write_all(dst_fd, data)
+    return len(data)
+
+
+_COPY_METHODS = [_copy_file_range, _sendfile, _buffered_copy]
+
+
+def copy_range(src_fd, dst_fd, offset, count):
+    """
+    Copy count bytes of src_fd starting at offset to dst_fd's current
+    position. Uses copy_file_range/sendfile so the bytes stay in the kernel,
+    falling back to a buffered copy where those are unavailable.
+    """
+    end = offset + count
+    for i, method in enumerate(_COPY_METHODS):
+        try:
+            while offset < end:
+                n = method(src_fd, dst_fd, offset, end - offset)
+                if n == 0:
+                    raise EOFError(f"copy_range: source ended at byte {offset}, expected {end}")
+                offset += n
+            return
+        except (AttributeError, OSError):
+            # Not supported here (ENOSYS, EXDEV, EINVAL...): try the next method
+            if i == len(_COPY_METHODS) - 1:
+                raise
+
+
+def prepare_splice(filepath, segments, durability=None):
+    """
+    Build a temp file for filepath from segments, in order:
+        (begin, end)        copy bytes [begin, end) of the current file
+        (path, begin, end)  copy bytes [begin, end) of another file
+        bytes               write literally
+    Copied regions stay in the kernel, so memory is O(new bytes).
+    Returns the temp path (see commit_temp / commit_all).
+    """
+    abs_path = os.path.abspath(filepath)
+    sources = {}
+    try:
+        sources[None] = open(abs_path, "rb")
         
-        # Atomic rename
-        shutil.move(tmp_path, abs_path)
-    except Exception:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
-        raise
+        def fill(fd):
+            for segment in segments:
+                if isinstance(segment, tuple):
+                    path, begin, end = segment if len(segment) == 3 else (None, *segment)
+                    if end > begin:
+                        if path not in sources:
+                            sources[path] = open(path, "rb")
+                        copy_range(sources[path].fileno(), fd, begin, end - begin)
+                elif segment:
+                    _write_all(fd, segment)
+        
+        return prepare_temp(abs_path, fill, durability=durability)
+    finally:
+        for src in sources.values():
+            src.close()
+
+
+def splice_file(filepath, segments, durability=None):
+    """Atomically rewrite filepath from segments (see prepare_splice)."""
+    tmp_path = prepare_splice(filepath, segments, durability=durability)
+    commit_temp(tmp_path, filepath, durability=durability)
+
+
+INPLACE_EOF_ENV = "FAST_EDIT_INPLACE_EOF"
 
 
-def detect_line_ending(lines):
-    """Detect dominant line ending style (LF or CRLF)."""
-    if not lines:
-        return "\n"
-    crlf_count = sum(1 for line in lines if line.endswith("\r\n"))
-    return "\r\n" if crlf_count > len(lines) // 2 else "\n"
+def splice_range(filepath, begin, end, data, size, durability=None):
+    """
+    Replace bytes [begin, end) of a file of the given size with data.
+
+    Edits reaching EOF are pure truncate/append; with FAST_EDIT_INPLACE_EOF=1
+    they are applied in place (O(edit) I/O, but not crash-atomic). Otherwise
+    the file is rebuilt atomically with splice_file.
+    """
+    if end == size and settings.get(INPLACE_EOF_ENV) == "1":
+        with open(os.path.abspath(filepath), "r+b") as f:
+            f.seek(begin)
+            f.write(data)
+            f.truncate()
+            if durability_mode(durability) != "none":
+                f.flush()
+                os.fsync(f.fileno())
+        return
+    splice_file(filepath, [(0, begin), data, (end, size)], durability=durability)
+
+
+SKIP_UNCHANGED_ENV = "FAST_EDIT_SKIP_UNCHANGED"
+COMPARE_CHUNK = 1 << 20
+# A digest is only cached for a file last modified at least this long before
+# it was taken: a rewrite within the same mtime tick would keep the
+# fingerprint and go unnoticed
+DIGEST_SETTLE_NS = 2_000_000_000
+MAX_DIGESTS = 4096
+
+_digests = {}  # abs path -> ((inode, size, mtime_ns), digest)
+
+
+def skip_unchanged(flag=None):
+    """
+    Resolve the skip-unchanged setting: explicit flag, else
+    $FAST_EDIT_SKIP_UNCHANGED. When on, writes whose result is byte-identical
+    to the current file leave it (and its mtime) untouched.
+    """
+    if flag is not None:
+        return bool(flag)
+    return settings.get(SKIP_UNCHANGED_ENV, "").lower() in ("1", "on", "true", "yes")
+
+
+def _segment_chunks(segment, sources):
+    """Bytes of one prepare_splice() segment, in chunks of at most COMPARE_CHUNK."""
+    if not isinstance(segment, tuple):
+        view = memoryview(segment)
+        for i in range(0, len(view), COMPARE_CHUNK):
+            yield view[i:i + COMPARE_CHUNK]
+        return
+    path, begin, end = segment if len(segment) == 3 else (None, *segment)
+    if path not in sources:
+        sources[path] = os.open(path, os.O_RDONLY)
+    while begin < end:
+        data = os.pread(sources[path], min(COMPARE_CHUNK, end - begin), begin)
+        if not data:
+            raise EOFError(f"{path}: ended at byte {begin}, expected {end}")
+        yield data
+        begin += len(data)
+
+
+def _segment_size(segment):
+    if isinstance(segment, tuple):
+        return segment[-1] - segment[-2]
+    return len(segment)
+
+
+def unchanged(filepath, segments):
+    """
+    Whether writing segments (as for prepare_splice) would leave filepath
+    byte-identical. Sizes are compared first. Then, if the file's current
+    version has a cached digest, the new bytes are hashed and compared
+    against it without reading the file. Otherwise both sides are read
+    chunk by chunk, stopping at the first difference. Ranges copied from the
+    same offset of the file itself are skipped.
+    """
+    import stat
+    abs_path = os.path.abspath(filepath)
+    try:
+        fd = os.open(abs_path, os.O_RDONLY)
+    except OSError:
+        return False
+    sources = {None: fd}
+    try:
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode) or st.st_size != sum(map(_segment_size, segments)):
+            return False
+        key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        external = all(not isinstance(s, tuple) or len(s) == 3 for s in segments)
+        cached = _digests.get(abs_path)
+        if external and cached is not None and cached[0] == key:
+            return _digest(segments, sources) == cached[1]
+
+        import time
+        # Hash along the way only if the result may be cached
+        hasher = None
+        if external and st.st_mtime_ns < time.time_ns() - DIGEST_SETTLE_NS:
+            import hashlib
+            hasher = hashlib.blake2b(digest_size=16)
+        pos = 0
+        for segment in segments:
+            if isinstance(segment, tuple) and len(segment) == 2 and segment[0] == pos:
+                pos = segment[1]
+                continue
+            for chunk in _segment_chunks(segment, sources):
+                if os.pread(fd, len(chunk), pos) != chunk:
+                    return False
+                if hasher is not None:
+                    hasher.update(chunk)
+                pos += len(chunk)
+        if hasher is not None:
+            _digests.pop(abs_path, None)
+            _digests[abs_path] = (key, hasher.digest())
+            if len(_digests) > MAX_DIGESTS:
+                del _digests[next(iter(_digests))]
+        return True
+    finally:
+        for src in sources.values():
+            os.close(src)
 
 
-def normalize_content(content, line_ending):
-    """Normalize content to use consistent line endings."""
-    if not content:
-        return ""
-    result = []
-    for line in content.splitlines(True):
-        stripped = line.rstrip("\r\n")
-        result.append(stripped + line_ending)
-    return "".join(result)
+def _digest(segments, sources):
+    import hashlib
+    hasher = hashlib.blake2b(digest_size=16)
+    for segment in segments:
+        for chunk in _segment_chunks(segment, sources):
+            hasher.update(chunk)
+    return hasher.digest()
 
 
 def validate_range(start, end, total, command):
@@ -80,3 +602,56 @@ def validate_range(start, end, total, command):
         raise ValueError(f"{command}: start ({start}) exceeds file length ({total} lines)")
     if end > total:
         raise ValueError(f"{command}: end ({end}) exceeds file length ({total} lines)")
+
+
+class StaleEditError(ValueError):
+    """
+    An edit's expected hash no longer matches the file. stale lists one
+    dict per rejected edit, including the lines currently on disk, so the
+    caller can retry without another show.
+    """
+
+    def __init__(self, message, stale):
+        super().__init__(message)
+        self.stale = stale
+
+    def __reduce__(self):
+        # Survive the trip back from a ProcessPoolExecutor worker
+        return type(self), (str(self), self.stale)
+
+
+# Hex digits in a line/range hash; an "expect" may give any prefix this long
+HASH_LEN = 8
+HASH_MIN_PREFIX = 4
+
+
+def _line_text(line):
+    """A line's bytes without its line ending."""
+    if line.endswith(b"\n"):
+        line = line[:-1]
+        if line.endswith(b"\r"):
+            line = line[:-1]
+    return line
+
+
+def line_hash(line):
+    """Short hash of one line (bytes, line ending excluded)."""
+    from hashlib import blake2b
+    return blake2b(_line_text(line), digest_size=HASH_LEN // 2).hexdigest()
+
+
+def range_hash(lines):
+    """Short hash of consecutive lines, independent of their line endings."""
+    from hashlib import blake2b
+    h = blake2b(digest_size=HASH_LEN // 2)
+    for i, line in enumerate(lines):
+        if i:
+            h.update(b"\n")
+        h.update(_line_text(line))
+    return h.hexdigest()
+
+
+def hash_matches(expected, actual):
+    """Whether expected is actual or a long enough prefix of it."""
+    expected = expected.lower()
+    return len(expected) >= HASH_MIN_PREFIX and actual.startswith(expected)
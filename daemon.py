@@ -0,0 +1,206 @@
+"""
+Persistent server mode for fast-edit.
+
+`fast_edit.py serve` keeps the interpreter and the editing modules warm and
+answers requests over a Unix domain socket, so each edit costs a socket
+round trip instead of interpreter startup plus imports.
+
+Protocol: one JSON line per connection in each direction.
+    request:  {"op": "run", "argv": [...], "cwd": "...", "stdin": "..." | null,
+               "env": {"FAST_EDIT_...": "..."}}
+              {"op": "status"} | {"op": "shutdown"}
+    response: {"code": 0|1, "result": {...}, "elapsed_ms": N}
+
+`result` is exactly the JSON the CLI prints; see fe_client.py for the shim.
+"""
+import io
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import threading
+import socketserver
+
+from fe_client import default_socket_path, reads_stdin
+
+
+DEFAULT_IDLE_TIMEOUT = 600
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        server = self.server
+        server.begin_request()
+        t0 = time.perf_counter()
+        try:
+            try:
+                response = server.dispatch(json.loads(line))
+            except Exception as e:
+                response = {"code": 1, "result": server.error_result(e)}
+            elapsed_ms = round((time.perf_counter() - t0) * 1000, 3)
+            response["elapsed_ms"] = elapsed_ms
+            self.wfile.write(
+                json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n"
+            )
+        finally:
+            server.end_request(elapsed_ms=(time.perf_counter() - t0) * 1000)
+
+
+class FastEditServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded Unix socket server that runs fast_edit commands in-process."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, idle_timeout=DEFAULT_IDLE_TIMEOUT, log=None):
+        import fast_edit
+        self.run = fast_edit.run
+        self.error_result = fast_edit.error_result
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.log = log
+        self.started = time.time()
+        self.requests = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.active = 0
+        self.last_activity = time.monotonic()
+        self.lock = threading.Lock()
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o600)
+
+    def begin_request(self):
+        with self.lock:
+            self.active += 1
+            self.last_activity = time.monotonic()
+
+    def end_request(self, elapsed_ms):
+        with self.lock:
+            self.active -= 1
+            self.requests += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self.last_activity = time.monotonic()
+
+    def dispatch(self, req):
+        op = req.get("op", "run")
+
+        if op == "status":
+            with self.lock:
+                count = self.requests
+                return {"code": 0, "result": {
+                    "status": "ok",
+                    "pid": os.getpid(),
+                    "socket": self.socket_path,
+                    "uptime_s": round(time.time() - self.started, 3),
+                    "requests": count,
+                    "active": self.active - 1,
+                    "avg_ms": round(self.total_ms / count, 3) if count else 0.0,
+                    "max_ms": round(self.max_ms, 3),
+                }}
+
+        if op == "shutdown":
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {"code": 0, "result": {"status": "ok", "message": "shutting down"}}
+
+        if op != "run":
+            raise ValueError(f"Unknown op: {op}")
+
+        argv = req.get("argv") or []
+        if not argv or argv[0] == "serve":
+            raise ValueError("daemon: expected a fast_edit command")
+
+        stdin = req.get("stdin")
+        if stdin is None and reads_stdin(argv):
+            # Never fall back to the daemon's own stdin
+            raise ValueError("daemon: command reads stdin but the request carries none")
+        t0 = time.perf_counter()
+        try:
+            result = self.run(
+                argv,
+                stdin=io.StringIO(stdin) if stdin is not None else None,
+                cwd=req.get("cwd"),
+                env=req.get("env"),
+            )
+            code = 0
+        except Exception as e:
+            result = self.error_result(e)
+            code = 1
+        self._log(argv[0], code, (time.perf_counter() - t0) * 1000)
+        return {"code": code, "result": result}
+
+    def _log(self, cmd, code, elapsed_ms):
+        if self.log is None:
+            return
+        entry = {"cmd": cmd, "code": code, "elapsed_ms": round(elapsed_ms, 3)}
+        print(json.dumps(entry), file=self.log, flush=True)
+
+    def watch_idle(self):
+        """Shut the server down once it has been idle for idle_timeout seconds."""
+        interval = min(self.idle_timeout, 1.0)
+        while True:
+            time.sleep(interval)
+            with self.lock:
+                idle = time.monotonic() - self.last_activity
+                busy = self.active > 0
+            if not busy and idle >= self.idle_timeout:
+                self.shutdown()
+                return
+
+
+def _remove_stale_socket(socket_path):
+    """Remove a leftover socket file, refusing if a live daemon owns it."""
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.remove(socket_path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"fast-edit daemon already running on {socket_path}")
+
+
+def serve(socket_path=None, idle_timeout=DEFAULT_IDLE_TIMEOUT, log=sys.stderr):
+    """
+    Run the daemon in the foreground until idle timeout, SIGTERM/SIGINT or a
+    shutdown request.
+
+    Args:
+        socket_path: Unix socket to listen on (default: see default_socket_path)
+        idle_timeout: Seconds without requests before exiting (0 = never)
+        log: Stream for one JSON latency line per request (None = quiet)
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("serve: Unix domain sockets are not available on this platform")
+
+    socket_path = socket_path or default_socket_path()
+    _remove_stale_socket(socket_path)
+    server = FastEditServer(socket_path, idle_timeout=idle_timeout, log=log)
+    
+    # Keep type-checker language servers warm between check requests
+    import sessions
+    sessions.persistent = True
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    if idle_timeout and idle_timeout > 0:
+        threading.Thread(target=server.watch_idle, daemon=True).start()
+
+    try:
+        server.serve_forever()
+    finally:
+        sessions.shutdown_all()
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -1,181 +1,774 @@
 """
-Edit operations: show, replace, insert, delete, batch.
+Edit operations: show, grep, replace, insert, delete, batch.
 All line numbers are 1-based and inclusive.
 """
 import os
+import time
+from itertools import islice
+import lineindex
+import journal
+import timings
+import settings
+from lineending import (
+    ENDINGS, BOM, Preserve, line_ending_mode, file_style, normalize, without_bom, with_bom, prefixed
+)
 from core import (
-    read_lines, write_file, 
-    detect_line_ending, normalize_content, validate_range
+    prepare_splice, commit_all, discard_temp, splice_range, durability_mode, count_lines, tail_lines, split_lines,
+    skip_unchanged, unchanged,
+    validate_range,
+    content_ref, read_ref, ref_ends_with_newline, ref_is_normalized,
+    StaleEditError, HASH_MIN_PREFIX, line_hash, range_hash, hash_matches
 )
 
 
-def show(filepath, start, end):
-    """Show lines with line numbers (for preview before editing)."""
-    lines = read_lines(filepath)
-    total = len(lines)
+def _clamp_window(start, end, total):
+    """Resolve negative (from-EOF) line numbers and clamp to 1..total."""
+    if start < 0:
+        start = total + 1 + start
+    if end < 0:
+        end = total + 1 + end
+    return max(1, start), min(total, end)
+
+
+def show(filepath, start, end, total=False, hashes=False):
+    """
+    Show lines with line numbers (for preview before editing).
+
+    Streams the file and stops at END, so cost scales with the window, not
+    the file. Negative START/END count from EOF (-1 = last line) and are read
+    backward from the end. With a cached line index the window is read by
+    seeking. "total" is null unless requested (or known anyway).
+    
+    With hashes, the result adds a hash per line and one for the whole
+    window; edits can pass either back as "expect" (see _guard).
+    """
+    abs_path = os.path.abspath(filepath)
+    index = lineindex.peek(abs_path)
     
-    # Clamp to valid range
-    start = max(1, start)
-    end = min(total, end)
+    with timings.phase("read"), open(abs_path, "rb") as f:
+        if index is not None:
+            # Cached line offsets: seek straight to the window
+            n_lines = index.total
+            start, end = _clamp_window(start, end, n_lines)
+            window = []
+            if end >= start:
+                begin, stop = index.span(start, end)
+                f.seek(begin)
+                window = split_lines(f.read(stop - begin))
+        elif start < 0 or end < 0:
+            n_lines = count_lines(f)
+            start, end = _clamp_window(start, end, n_lines)
+            window = tail_lines(f, n_lines - start + 1)[:max(0, end - start + 1)]
+        else:
+            start = max(1, start)
+            window = list(islice(f, start - 1, max(start - 1, end)))
+            end = min(end, start - 1 + len(window))
+            n_lines = None
+            if total and window:
+                n_lines = end + count_lines(f)
+            elif total:
+                f.seek(0)
+                n_lines = count_lines(f)
+                end = min(n_lines, end)
     
     # Format with line numbers
-    output = []
-    for i in range(start - 1, end):
-        output.append(f"{i + 1}\t{lines[i].rstrip()}")
+    timings.count("lines_out", len(window))
+    with timings.phase("format"):
+        output = []
+        for i, line in enumerate(window, start):
+            output.append(f"{i}\t{line.decode('utf-8').rstrip()}")
     
-    return {
+    result = {
         "status": "ok",
-        "file": os.path.abspath(filepath),
+        "file": abs_path,
         "start": start,
         "end": end,
-        "total": total,
+        "total": n_lines,
         "content": "\n".join(output)
     }
+    if hashes:
+        with timings.phase("hash"):
+            result["hashes"] = [line_hash(line) for line in window]
+            result["hash"] = range_hash(window)
+    return result
+
+
+def _line_bounds(mm, pos):
+    """Byte range [begin, end) of the line containing pos, without its newline."""
+    begin = mm.rfind(b"\n", 0, pos) + 1
+    end = mm.find(b"\n", pos)
+    return begin, len(mm) if end < 0 else end
+
+
+def _grep_file(filepath, matcher, context, max_count):
+    """Scan one file through mmap; returns its result entry for grep()."""
+    import mmap
+    
+    abs_path = os.path.abspath(filepath)
+    matches = []
+    truncated = False
+    with open(abs_path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return {"file": abs_path, "matches": matches, "truncated": truncated}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            index = lineindex.peek(abs_path)
+            line_no, counted = 1, 0
+            pos = 0
+            while pos <= size:
+                hit = matcher(mm, pos)
+                if hit < 0 or (hit == size and mm[size - 1] == 0x0A):
+                    break
+                if max_count is not None and len(matches) >= max_count:
+                    truncated = True
+                    break
+                if index is not None:
+                    line_no = index.line_at(hit)
+                else:
+                    line_no += mm[counted:hit].count(b"\n")
+                    counted = hit
+                begin, end = _line_bounds(mm, hit)
+                
+                # Context window, walking line starts outward from the hit
+                first, lo = line_no, begin
+                while first > line_no - context and lo > 0:
+                    lo = mm.rfind(b"\n", 0, lo - 1) + 1
+                    first -= 1
+                hi = end
+                for _ in range(context):
+                    if hi >= size - 1:  # no line after a final newline
+                        break
+                    nxt = mm.find(b"\n", hi + 1)
+                    hi = size if nxt < 0 else nxt
+                
+                # mm[lo:hi] has no newline after its last line, so splitting on
+                # newlines yields every line, an empty last one included
+                output = []
+                for i, line in enumerate(mm[lo:hi].split(b"\n"), first):
+                    output.append(f"{i}\t{line.decode('utf-8', 'replace').rstrip()}")
+                matches.append({
+                    "line": line_no,
+                    "col": hit - begin + 1,
+                    "content": "\n".join(output),
+                })
+                # One match per line, like grep
+                pos = end + 1
+    
+    return {"file": abs_path, "matches": matches, "truncated": truncated}
+
+
+def grep(filepaths, pattern, regex=False, ignore_case=False, context=0,
+         max_count=None, workers=None):
+    """
+    Find the lines matching a literal string (or regex) in one or more files.
+    
+    Files are memory-mapped and scanned as bytes; only matching lines (plus
+    context lines on each side) are decoded, and each is reported with its
+    line number and 1-based byte column, in the same numbered format as
+    show. Several files are searched in a thread pool. max_count stops a
+    file's scan after that many matching lines ("truncated": true).
+    """
+    import re
+    
+    needle = pattern.encode("utf-8")
+    if regex or ignore_case:
+        compiled = re.compile(
+            needle if regex else re.escape(needle),
+            re.MULTILINE | (re.IGNORECASE if ignore_case else 0),
+        )
+        
+        def matcher(mm, pos):
+            while True:
+                m = compiled.search(mm, pos)
+                if m is None:
+                    return -1
+                if mm.find(b"\n", m.start(), m.end()) < 0:
+                    return m.start()
+                # The match runs into the next line: search its first line alone
+                begin, end = _line_bounds(mm, m.start())
+                m = compiled.search(mm, max(begin, pos), end)
+                if m is not None:
+                    return m.start()
+                if end >= len(mm):
+                    return -1
+                pos = end + 1
+    else:
+        def matcher(mm, pos):
+            return mm.find(needle, pos)
+    
+    if len(filepaths) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                lambda path: _grep_file(path, matcher, context, max_count), filepaths
+            ))
+    else:
+        results = [_grep_file(path, matcher, context, max_count) for path in filepaths]
+    
+    return {
+        "status": "ok",
+        "pattern": pattern,
+        "files": len(results),
+        "matches": sum(len(r["matches"]) for r in results),
+        "results": results,
+    }
 
 
-def replace(filepath, start, end, content):
-    """Replace lines start..end with new content."""
-    lines = read_lines(filepath)
-    validate_range(start, end, len(lines), "replace")
+def _guard(filepath, index, checks, command):
+    """
+    Optimistic concurrency check: each (start, end, expected, label) in
+    checks must still hash to expected over lines start..end. Only those
+    ranges are read. Raises StaleEditError listing the current lines of every
+    mismatch, or ValueError for a hash prefix shorter than HASH_MIN_PREFIX
+    or an empty range (an insert after line 0 has no line to guard).
+    """
+    abs_path = os.path.abspath(filepath)
+    for start, end, expected, label in checks:
+        if len(expected) < HASH_MIN_PREFIX:
+            raise ValueError(f"{command}: {label}: hash prefix too short "
+                             f"({expected!r}; use at least {HASH_MIN_PREFIX} hex digits)")
+        if end < start:
+            raise ValueError(f"{command}: {label}: nothing to guard, "
+                             f"expect needs a line >= 1")
+    stale = []
+    with open(abs_path, "rb") as f:
+        for start, end, expected, label in checks:
+            begin, stop = index.span(start, end)
+            f.seek(begin)
+            lines = split_lines(f.read(stop - begin))
+            actual = range_hash(lines)
+            if hash_matches(expected, actual):
+                continue
+            content = [f"{i}\t{line.decode('utf-8', 'replace').rstrip()}"
+                       for i, line in enumerate(lines, start)]
+            stale.append({
+                "file": abs_path,
+                "edit": label,
+                "start": start,
+                "end": end,
+                "expected": expected,
+                "actual": actual,
+                "content": "\n".join(content),
+            })
     
-    le = detect_line_ending(lines)
-    new_content = normalize_content(content, le)
+    if len(stale) == 1:
+        s = stale[0]
+        raise StaleEditError(
+            f"{command}: {s['edit']} changed since read (expected {s['expected']}, now {s['actual']})",
+            stale,
+        )
+    if stale:
+        raise StaleEditError(f"{command}: {len(stale)} edits changed since read", stale)
+
+
+def _anchor(line):
+    """Guarded range of an insert after line (the line itself; empty for 0, see _guard)."""
+    return (line, line) if line > 0 else (1, 0)
+
+
+def _line_style(filepath, index, mode):
+    """
+    Line ending of new text under a line ending mode (see lineending), and
+    the Preserve that supplies per-line endings in "preserve" mode (else None).
+    """
+    if mode in ENDINGS:
+        return ENDINGS[mode], None
+    le, bom = file_style(filepath)
+    if mode == "preserve":
+        return le, Preserve(os.path.abspath(filepath), index, le, bom)
+    return le, None
+
+
+def _new_text(content, le, preserve, first, last):
+    """content normalized to replace lines first..last (last = first - 1: inserted)."""
+    if preserve is None:
+        return normalize(content, le)
+    return preserve.text(content, first, last)
+
+
+def _ends_with_newline(filepath, index):
+    """Whether the last line of the file is newline-terminated."""
+    if not index.size:
+        return True
+    with open(os.path.abspath(filepath), "rb") as f:
+        f.seek(index.size - 1)
+        return f.read(1) == b"\n"
+
+
+def _count(index, data):
+    """Timing counters of a single-range edit (file size and lines, new bytes)."""
+    timings.count("bytes_in", index.size)
+    timings.count("lines_in", index.total)
+    timings.count("bytes_new", len(data))
+
+
+def replace(filepath, start, end, content, durability=None, expect=None, line_ending=None):
+    """
+    Replace lines start..end with new content (guarded by expect, see show).
+    line_ending: mode for the new lines (see lineending; default auto).
+    """
+    with timings.phase("index"):
+        index = lineindex.get_index(filepath)
+    total = index.total
+    validate_range(start, end, total, "replace")
+    if expect:
+        with timings.phase("guard"):
+            _guard(filepath, index, [(start, end, expect, f"lines {start}-{end}")], "replace")
     
-    # Ensure trailing newline if not at EOF
-    if new_content and not new_content.endswith(("\n", "\r\n")) and end < len(lines):
-        new_content += le
+    mode = line_ending_mode(line_ending)
+    with timings.phase("line_ending"):
+        le, preserve = _line_style(filepath, index, mode)
+    with timings.phase("normalize"):
+        new_content = _new_text(content, le, preserve, start, end)
     
-    new_lines = new_content.splitlines(True) if new_content else []
-    result = lines[:start - 1] + new_lines + lines[end:]
-    write_file(filepath, result)
+    new_lines = split_lines(new_content.encode("utf-8"))
+    data = b"".join(new_lines)
+    bom = preserve is not None and preserve.bom and start == 1
+    if bom:
+        index = without_bom(index)
+    begin, stop = index.span(start, end)
+    _count(index, data)
+    with timings.phase("journal"):
+        old = journal.read_span(filepath, begin, stop) if journal.enabled() else b""
+    with timings.phase("write"):
+        splice_range(filepath, begin, stop, data, index.size, durability)
+    with timings.phase("journal"):
+        journal.record("replace", [
+            {"path": os.path.abspath(filepath), "size": index.size, "hunks": [(begin, old, data)]}
+        ])
+    with timings.phase("index_store"):
+        index = index.splice(start, end, map(len, new_lines))
+        if bom:
+            index = with_bom(index)
+        lineindex.store(filepath, index)
     
     return {
         "status": "ok",
         "file": os.path.abspath(filepath),
         "removed": end - start + 1,
         "added": len(new_lines),
-        "total": len(result)
+        "total": index.total
     }
 
 
-def insert(filepath, after_line, content):
-    """Insert content after specified line (0 = prepend to file)."""
-    lines = read_lines(filepath)
+def insert(filepath, after_line, content, durability=None, expect=None, line_ending=None):
+    """
+    Insert content after specified line (0 = prepend to file). expect
+    guards the hash of that line; line_ending as for replace.
+    """
+    with timings.phase("index"):
+        index = lineindex.get_index(filepath)
+    total = index.total
     
-    if after_line < 0 or after_line > len(lines):
-        raise ValueError(f"insert: line ({after_line}) out of range (0..{len(lines)})")
+    if after_line < 0 or after_line > total:
+        raise ValueError(f"insert: line ({after_line}) out of range (0..{total})")
+    if expect:
+        with timings.phase("guard"):
+            _guard(filepath, index, [(*_anchor(after_line), expect, f"line {after_line}")],
+                   "insert")
     
-    le = detect_line_ending(lines)
-    new_content = normalize_content(content, le)
+    mode = line_ending_mode(line_ending)
+    with timings.phase("line_ending"):
+        le, preserve = _line_style(filepath, index, mode)
+    with timings.phase("normalize"):
+        new_content = _new_text(content, le, preserve, after_line + 1, after_line)
     
-    # Ensure trailing newline
-    if new_content and not new_content.endswith(("\n", "\r\n")):
-        new_content += le
+    new_lines = split_lines(new_content.encode("utf-8"))
+    data = b"".join(new_lines)
+    lengths = list(map(len, new_lines))
+    splice_from = after_line + 1
     
-    # Ensure previous line has newline
-    if after_line > 0 and lines[after_line - 1] and not lines[after_line - 1].endswith(("\n", "\r\n")):
-        lines[after_line - 1] += le
+    # Ensure previous line has newline (only the last line can lack one)
+    if after_line > 0 and after_line == total and not _ends_with_newline(filepath, index):
+        begin, stop = index.span(after_line, after_line)
+        data = le.encode("utf-8") + data
+        lengths.insert(0, stop - begin + len(le))
+        splice_from = after_line
     
-    new_lines = new_content.splitlines(True) if new_content else []
-    result = lines[:after_line] + new_lines + lines[after_line:]
-    write_file(filepath, result)
+    # Prepended text goes after a preserved BOM
+    bom = preserve is not None and preserve.bom and after_line == 0
+    if bom:
+        index = without_bom(index)
+    pos = index.offsets[after_line]
+    _count(index, data)
+    with timings.phase("write"):
+        splice_range(filepath, pos, pos, data, index.size, durability)
+    with timings.phase("journal"):
+        journal.record("insert", [
+            {"path": os.path.abspath(filepath), "size": index.size, "hunks": [(pos, b"", data)]}
+        ])
+    with timings.phase("index_store"):
+        index = index.splice(splice_from, after_line, lengths)
+        if bom:
+            index = with_bom(index)
+        lineindex.store(filepath, index)
     
     return {
         "status": "ok",
         "file": os.path.abspath(filepath),
         "after": after_line,
         "added": len(new_lines),
-        "total": len(result)
+        "total": index.total
     }
 
 
-def delete(filepath, start, end):
-    """Delete lines start..end."""
-    lines = read_lines(filepath)
-    validate_range(start, end, len(lines), "delete")
+def delete(filepath, start, end, durability=None, expect=None, line_ending=None):
+    """
+    Delete lines start..end (guarded by expect, see show). With line_ending
+    "preserve", deleting line 1 keeps the file's BOM.
+    """
+    with timings.phase("index"):
+        index = lineindex.get_index(filepath)
+    validate_range(start, end, index.total, "delete")
+    if expect:
+        with timings.phase("guard"):
+            _guard(filepath, index, [(start, end, expect, f"lines {start}-{end}")], "delete")
     
-    result = lines[:start - 1] + lines[end:]
-    write_file(filepath, result)
+    bom = line_ending_mode(line_ending) == "preserve" and start == 1 and file_style(filepath)[1]
+    if bom:
+        index = without_bom(index)
+    begin, stop = index.span(start, end)
+    _count(index, b"")
+    with timings.phase("journal"):
+        old = journal.read_span(filepath, begin, stop) if journal.enabled() else b""
+    with timings.phase("write"):
+        splice_range(filepath, begin, stop, b"", index.size, durability)
+    with timings.phase("journal"):
+        journal.record("delete", [
+            {"path": os.path.abspath(filepath), "size": index.size, "hunks": [(begin, old, b"")]}
+        ])
+    with timings.phase("index_store"):
+        index = index.splice(start, end, [])
+        if bom:
+            index = with_bom(index)
+        lineindex.store(filepath, index)
     
     return {
         "status": "ok",
         "file": os.path.abspath(filepath),
         "removed": end - start + 1,
-        "total": len(result)
+        "total": index.total
     }
 
 
+def _describe(hunk):
+    if hunk["action"] == "insert-after":
+        return f"insert-after {hunk['end']}"
+    return f"{hunk['action']} {hunk['start']}-{hunk['end']}"
+
+
+def _edit_pieces(edit, le, first, last, preserve=None):
+    """
+    New text of a batch edit replacing lines first..last (last = first - 1:
+    inserted) as a list of pieces: bytes, or a content_ref() span copied
+    straight from disk when it already uses the line ending it would get.
+    """
+    ref = content_ref(edit)
+    eol = le if preserve is None else preserve.uniform(first, last)
+    if ref is not None and ref["end"] > ref["begin"] and eol and ref_is_normalized(ref, eol):
+        if not ref_ends_with_newline(ref):
+            # Terminated like normalized inline content
+            return [ref, eol.encode("utf-8")]
+        return [ref]
+    
+    text = read_ref(ref).decode("utf-8") if ref is not None else edit.get("content", "")
+    return [_new_text(text, le, preserve, first, last).encode("utf-8")]
+
+
+def _plan(edits, total, le, preserve=None):
+    """
+    Validate every edit against the original line numbering and return them
+    as hunks sorted into output order. Each hunk replaces lines start..end
+    (end = start - 1 for an insertion) with its pieces (see _edit_pieces).
+
+    Ordering: inserts at the same point keep their input order; an insert
+    after line N comes after a range ending at N and before one starting at
+    N + 1. Overlapping ranges, or an insert inside a replaced/deleted range,
+    raise ValueError.
+    """
+    hunks = []
+    for order, edit in enumerate(edits):
+        action = edit["action"]
+        
+        if action in ("replace-lines", "delete-lines"):
+            s, e = edit["start"], edit["end"]
+            short = "replace" if action == "replace-lines" else "delete"
+            validate_range(s, e, total, f"batch/{short}")
+            pieces = []
+            if action == "replace-lines":
+                pieces = _edit_pieces(edit, le, s, e, preserve)
+            key = (s, 1, order)
+            
+        elif action == "insert-after":
+            ln = edit["line"]
+            if ln < 0 or ln > total:
+                raise ValueError(f"batch/insert: line ({ln}) out of range")
+            s, e = ln + 1, ln
+            pieces = _edit_pieces(edit, le, s, e, preserve)
+            key = (s, 0, order)
+            
+        else:
+            raise ValueError(f"Unknown action: {action}")
+        
+        hunks.append({
+            "key": key, "action": action, "start": s, "end": e, "pieces": pieces,
+            "expect": edit.get("expect"),
+        })
+    
+    hunks.sort(key=lambda h: h["key"])
+    
+    covered = 0
+    last = None
+    for hunk in hunks:
+        is_range = hunk["end"] >= hunk["start"]
+        if (hunk["start"] <= covered) if is_range else (hunk["end"] < covered):
+            raise ValueError(f"batch: conflicting edits: {_describe(last)} and {_describe(hunk)}")
+        if is_range:
+            covered = hunk["end"]
+            last = hunk
+    
+    return hunks
+
+
+def _render(index, hunks, le, ends_with_newline):
+    """
+    Lay out the edited file in one pass over the original: returns splice
+    segments for core.splice_file and the new LineIndex.
+    
+    Lines are never joined: if output so far ends mid-line (replacement
+    text without a newline, or a file lacking a final newline) and more
+    output follows, a line ending is added first.
+    """
+    total = index.total
+    eol = le.encode("utf-8")
+    builder = lineindex.IndexBuilder()
+    segments = []
+    
+    def copy(start, end):
+        if end < start:
+            return
+        if builder.open:
+            segments.append(eol)
+            builder.write(eol)
+        segments.append(index.span(start, end))
+        builder.copy(index, start, end, open_end=(end == total and not ends_with_newline))
+    
+    def write(pieces, force_eol=False):
+        if builder.open and (force_eol or any(pieces)):
+            segments.append(eol)
+            builder.write(eol)
+        for piece in pieces:
+            if isinstance(piece, dict):
+                # Referenced content: copied from its file, never read here
+                region = lineindex.region_index(piece)
+                segments.append((piece["path"], piece["begin"], piece["end"]))
+                builder.copy(region, 1, region.total, open_end=not ref_ends_with_newline(piece))
+            elif piece:
+                segments.append(piece)
+                builder.write(piece)
+    
+    cursor = 1
+    for hunk in hunks:
+        copy(cursor, hunk["start"] - 1)
+        # An insert always terminates the line before it, even when empty
+        write(hunk["pieces"], force_eol=hunk["action"] == "insert-after")
+        cursor = max(cursor, hunk["end"] + 1)
+    copy(cursor, total)
+    
+    return segments, builder.finish()
+
+
+def _prepare_file(file_spec, durability=None, skip_unchanged=False, timed=False, line_ending=None,
+                  env=None):
+    """
+    Phase 1 of batch for one file: plan and render its edits into a temp
+    file next to it. Nothing is renamed; returns what the commit needs.
+    line_ending is the spec's mode, unless the file spec sets its own; env
+    the caller's settings (see settings.using) for workers.
+    With skip_unchanged, no temp file is made ("tmp" is None) when the
+    edits leave the file byte-identical. With timed, it also carries the
+    file's own "timings" (recorded in whichever worker ran it).
+    """
+    t0 = time.perf_counter()
+    filepath = os.path.abspath(file_spec["file"])
+    edits = file_spec["edits"]
+    
+    with settings.using(env), timings.record(timed) as recorder:
+        mode = line_ending_mode(file_spec.get("line_ending", line_ending))
+        with timings.phase("index"):
+            index = lineindex.get_index(filepath)
+        with timings.phase("line_ending"):
+            le, preserve = _line_style(filepath, index, mode)
+        with timings.phase("plan"):
+            hunks = _plan(edits, index.total, le, preserve)
+        checks = [
+            (*(_anchor(h["end"]) if h["action"] == "insert-after" else (h["start"], h["end"])),
+             h["expect"], _describe(h))
+            for h in hunks if h["expect"]
+        ]
+        if checks:
+            with timings.phase("guard"):
+                _guard(filepath, index, checks, "batch")
+        with timings.phase("render"):
+            bom = preserve is not None and preserve.bom and hunks and hunks[0]["start"] == 1
+            segments, new_index = _render(
+                without_bom(index) if bom else index, hunks, le, _ends_with_newline(filepath, index)
+            )
+            if bom:
+                segments.insert(0, BOM)
+                new_index = prefixed(new_index)
+        tmp_path = change = None
+        same = False
+        if skip_unchanged:
+            with timings.phase("compare"):
+                same = unchanged(filepath, segments)
+        if not same:
+            if journal.enabled():
+                # Reverse delta for the undo journal: only the edited ranges are read
+                with timings.phase("journal"):
+                    change = {"path": filepath, "size": index.size,
+                              "hunks": journal.delta(filepath, segments, index.size)}
+            with timings.phase("write_temp"):
+                tmp_path = prepare_splice(filepath, segments, durability)
+        timings.count("bytes_in", index.size)
+        timings.count("lines_in", index.total)
+        timings.count("bytes_out", new_index.size)
+        timings.count("lines_out", new_index.total)
+    
+    return {
+        "file": filepath,
+        "tmp": tmp_path,
+        "change": change,
+        "offsets": new_index.offsets,
+        "edits": len(edits),
+        "prepare_ms": (time.perf_counter() - t0) * 1000,
+        "timings": recorder.result() if recorder is not None else None,
+    }
+
+
+def _prepare_all(file_specs, workers, executor, durability, skip_unchanged=False, timed=False,
+                 line_ending=None):
+    """Run _prepare_file for every spec in a thread (or process) pool."""
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+    
+    pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    prepared = []
+    errors = []
+    stale = []
+    with pool_cls(max_workers=workers) as pool:
+        env = settings.current()
+        futures = [pool.submit(_prepare_file, fs, durability, skip_unchanged, timed, line_ending, env)
+                   for fs in file_specs]
+        for file_spec, future in zip(file_specs, futures):
+            try:
+                prepared.append(future.result())
+            except Exception as e:
+                errors.append(f"{os.path.abspath(file_spec['file'])}: {e}")
+                stale.extend(getattr(e, "stale", ()))
+    
+    if errors:
+        for item in prepared:
+            if item["tmp"] is not None:
+                discard_temp(item["tmp"])
+        message = f"batch: {len(errors)} file(s) failed, nothing written: " + "; ".join(errors)
+        if stale:
+            raise StaleEditError(message, stale)
+        raise ValueError(message)
+    return prepared
+
+
 def batch(spec):
     """
     Execute multiple edits atomically.
-    Edits are auto-sorted back-to-front to prevent line number shifts.
+    All edits address the original line numbers; they are validated and
+    checked for conflicts up front, then the file is rewritten in a single
+    pass (untouched runs of lines are copied kernel-side).
+    
+    Multi-file specs are transactional: every file is first prepared into
+    a temp file (in parallel), and only if all succeed are they renamed into
+    place; a failure in either phase leaves every file untouched.
     
     JSON format:
         {"file": "...", "edits": [...]}
-        or {"files": [{"file": "...", "edits": [...]}, ...]}
+        or {"files": [{"file": "...", "edits": [...]}, ...],
+            "workers": N, "executor": "thread" | "process"}
+        Either form may set "durability": "none" | "file" | "file+dir", and
+        "skip_unchanged": true to leave files the edits would not change
+        untouched (reported with "unchanged": true; default:
+        $FAST_EDIT_SKIP_UNCHANGED), and "line_ending": "auto" | "lf" |
+        "crlf" | "preserve" for the new lines (see lineending; a file spec
+        may set its own; default: $FAST_EDIT_LINE_ENDING, else auto).
     
     Edit actions:
         {"action": "replace-lines", "start": N, "end": M, "content": "..."}
         {"action": "insert-after", "line": N, "content": "..."}
         {"action": "delete-lines", "start": N, "end": M}
+    
+    Any edit may carry "expect": a hash from show --hashes of its range
+    (for insert-after, of line N). If the file changed there, nothing is
+    written and the error lists the current lines ("stale").
+    
+    Instead of "content", replace/insert may reference text on disk, which
+    is copied file-to-file when its line endings already match:
+        "content_file": "path"
+        "content_range": {"file": "path", "start": N, "end": M, "unit": "lines" | "bytes"}
     """
+    t0 = time.perf_counter()
     file_specs = spec.get("files", [spec])
-    results = []
     
+    seen = set()
     for file_spec in file_specs:
-        filepath = file_spec["file"]
-        edits = file_spec["edits"]
-        
-        lines = read_lines(filepath)
-        le = detect_line_ending(lines)
-        
-        # Sort edits from bottom to top (prevents line number shifting)
-        sorted_edits = sorted(
-            edits, 
-            key=lambda e: -(e.get("start") or e.get("line", 0))
-        )
-        
-        for edit in sorted_edits:
-            action = edit["action"]
-            
-            if action == "replace-lines":
-                s, e = edit["start"], edit["end"]
-                validate_range(s, e, len(lines), "batch/replace")
-                new_content = normalize_content(edit.get("content", ""), le)
-                if new_content and not new_content.endswith(("\n", "\r\n")) and e < len(lines):
-                    new_content += le
-                new_lines = new_content.splitlines(True) if new_content else []
-                lines = lines[:s - 1] + new_lines + lines[e:]
-                
-            elif action == "insert-after":
-                ln = edit["line"]
-                if ln < 0 or ln > len(lines):
-                    raise ValueError(f"batch/insert: line ({ln}) out of range")
-                new_content = normalize_content(edit.get("content", ""), le)
-                if new_content and not new_content.endswith(("\n", "\r\n")):
-                    new_content += le
-                if ln > 0 and lines[ln - 1] and not lines[ln - 1].endswith(("\n", "\r\n")):
-                    lines[ln - 1] += le
-                new_lines = new_content.splitlines(True) if new_content else []
-                lines = lines[:ln] + new_lines + lines[ln:]
-                
-            elif action == "delete-lines":
-                s, e = edit["start"], edit["end"]
-                validate_range(s, e, len(lines), "batch/delete")
-                lines = lines[:s - 1] + lines[e:]
-                
-            else:
-                raise ValueError(f"Unknown action: {action}")
-        
-        write_file(filepath, lines)
-        results.append({
-            "file": os.path.abspath(filepath),
-            "edits": len(edits),
-            "total": len(lines)
-        })
+        abs_path = os.path.abspath(file_spec["file"])
+        if abs_path in seen:
+            raise ValueError(f"batch: file listed more than once: {abs_path}")
+        seen.add(abs_path)
+    
+    durability = durability_mode(spec.get("durability"))
+    skip = skip_unchanged(spec.get("skip_unchanged"))
+    line_ending = spec.get("line_ending")
+    timed = timings.current() is not None
+    with timings.phase("prepare"):
+        if len(file_specs) > 1:
+            prepared = _prepare_all(
+                file_specs, spec.get("workers"), spec.get("executor", "thread"), durability,
+                skip, timed, line_ending
+            )
+        else:
+            prepared = [_prepare_file(fs, durability, skip, timed, line_ending) for fs in file_specs]
+    
+    t1 = time.perf_counter()
+    with timings.phase("commit"):
+        commit_all([(item["tmp"], item["file"]) for item in prepared if item["tmp"] is not None],
+                   durability)
+    commit_ms = (time.perf_counter() - t1) * 1000
+    with timings.phase("journal"):
+        journal.record("batch", [item["change"] for item in prepared if item["change"]])
+    
+    results = []
+    for item in prepared:
+        new_index = lineindex.LineIndex(item["offsets"])
+        result = {
+            "file": item["file"],
+            "edits": item["edits"],
+            "total": new_index.total,
+            "elapsed_ms": round(item["prepare_ms"], 3),
+        }
+        if item["tmp"] is None:
+            result["unchanged"] = True
+        else:
+            with timings.phase("index_store"):
+                lineindex.store(item["file"], new_index)
+        if timed:
+            # Per-file phases ran in the workers; their counts add up here
+            result["timings"] = item["timings"]
+            for name, n in item["timings"]["counts"].items():
+                timings.count(name, n)
+        results.append(result)
     
     return {
         "status": "ok",
         "files": len(results),
-        "results": results
+        "results": results,
+        "commit_ms": round(commit_ms, 3),
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 3),
     }
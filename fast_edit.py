@@ -3,15 +3,51 @@
 fast_edit — AI file editing tool with line-number addressing.
 
 Commands:
-    show FILE START END              Show lines with line numbers
+    show FILE START END [--total] [--hashes]
+                                     Show lines with line numbers (-N = from EOF)
+    grep PATTERN FILE... [--regex] [--ignore-case] [--context N] [--max-count N]
+                                     Find matching lines (alias: find-lines)
     replace FILE START END CONTENT   Replace line range
     insert FILE LINE CONTENT         Insert after line (0=prepend)
     delete FILE START END            Delete line range
     batch [--stdin] [SPEC]           Batch edit from JSON
-    paste FILE [--stdin] [--extract] [--base64]  Save from clipboard/stdin
+    paste FILE [--stdin] [--extract] [--base64] [--line-ending MODE]
+                                     Save from clipboard/stdin (streamed)
     write [--stdin] [SPEC]           Batch write files from JSON
-    check FILE [--checker NAME]      Type check Python file
+    check FILE... [--checker NAME[,NAME]] [--from-batch SPEC] [--cold] [--no-cache]
+          [--no-precheck] [--lines START-END[,...] | --since-edit] [--context N]
+                                     Type check Python files
     save-pasted FILE [--min-lines N] [--msg-id ID] [--extract] [--nth N]
+          [--line-ending MODE]
+    undo [PATH]                      Revert the last edit in PATH's repo (default: cwd)
+    redo [PATH]                      Re-apply the last undone edit
+    log [PATH] [--limit N]           List journaled edits, newest first
+    serve [--socket PATH] [--idle-timeout SECONDS]  Run as a persistent daemon
+
+Options:
+    --durability MODE   none | file | file+dir: fsync policy for writes
+                        (or set FAST_EDIT_DURABILITY; batch/write specs
+                        may also set "durability")
+    --skip-unchanged    paste/write/batch/save-pasted: leave files whose content
+                        would not change untouched, mtime included, and report
+                        "unchanged": true (or FAST_EDIT_SKIP_UNCHANGED=1; specs
+                        may also set "skip_unchanged")
+    --syntax-check      replace/insert/batch: parse edited .py files afterwards
+                        and report "syntax" errors (or FAST_EDIT_SYNTAX_CHECK=1)
+    --expect HASH       replace/insert/delete: refuse if the target lines no
+                        longer match a hash from show --hashes
+    --line-ending MODE  replace/insert/delete/batch: auto | lf | crlf | preserve
+                        for the new lines (or FAST_EDIT_LINE_ENDING; batch specs
+                        may also set "line_ending"); preserve keeps each replaced
+                        line's ending and a leading BOM. paste/save-pasted:
+                        lf | crlf convert every line break, auto | preserve
+                        (default) keep them as they arrive
+    --timings           Add a "timings" object (per-phase ms, byte/line counts)
+                        to the result (or set FAST_EDIT_TIMINGS=1)
+    --profile PATH      Write cProfile stats of the command to PATH
+                        (read with python3 -m pstats PATH)
+    --startup-profile   Report an -X importtime breakdown on stderr
+                        (or set FAST_EDIT_STARTUP_PROFILE=1)
 
 Line numbers: 1-based, inclusive. Output: JSON.
 """
@@ -24,10 +60,8 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 if SCRIPT_DIR not in sys.path:
     sys.path.insert(0, SCRIPT_DIR)
 
-import edit
-import paste
-import pasted
-import check
+# Command modules are imported inside run() so each subcommand only pays
+# for what it uses (see bench/startup.py for the cold-start budget).
 
 
 def parse_content(text):
@@ -44,94 +78,406 @@ def get_arg(args, flag):
         return None
 
 
-def main():
-    args = sys.argv[1:]
-    
-    if not args:
-        print(__doc__)
-        sys.exit(0)
+# Flags that take a value (skipped when looking for positional arguments)
+VALUE_FLAGS = {
+    "--checker", "--min-lines", "--msg-id", "--nth", "--durability",
+    "--socket", "--idle-timeout", "--context", "--max-count",
+    "--expect", "--limit", "--from-batch", "--lines", "--line-ending", "--profile",
+}
+
+
+def positionals(args):
+    """Arguments that are neither flags nor flag values."""
+    result = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in VALUE_FLAGS:
+            skip = True
+        elif not arg.startswith("--"):
+            result.append(arg)
+    return result
+
+
+def parse_ranges(text):
+    """Parse "10-20,42" into [(10, 20), (42, 42)]."""
+    ranges = []
+    for part in text.split(","):
+        start, _, end = part.partition("-")
+        ranges.append((int(start), int(end or start)))
+    return ranges
+
+
+def resolve_path(path, cwd=None):
+    """Resolve a CLI path against the caller's working directory."""
+    if cwd and not os.path.isabs(path):
+        return os.path.join(cwd, path)
+    return path
+
+
+def _resolve_refs(entry, cwd):
+    """Resolve content_file / content_range paths of one edit or write entry."""
+    if "content_file" in entry:
+        entry["content_file"] = resolve_path(entry["content_file"], cwd)
+    if "file" in (entry.get("content_range") or ()):
+        entry["content_range"]["file"] = resolve_path(entry["content_range"]["file"], cwd)
+
+
+def resolve_spec(spec, cwd=None):
+    """Resolve relative paths of a batch/write spec (files and content refs) against cwd."""
+    if not cwd:
+        return spec
+    for file_spec in spec.get("files", [spec]):
+        if "file" in file_spec:
+            file_spec["file"] = resolve_path(file_spec["file"], cwd)
+        _resolve_refs(file_spec, cwd)
+        for edit in file_spec.get("edits", []):
+            _resolve_refs(edit, cwd)
+    return spec
+
+
+def load_spec(rest, stdin=None, cwd=None):
+    """
+    Load a JSON spec from stdin (--stdin) or from the file named in rest.
+    A --durability flag overrides the spec's own "durability" (and
+    --line-ending its "line_ending"), and --skip-unchanged sets
+    "skip_unchanged".
+    """
+    import timings
+    with timings.phase("parse_spec"):
+        if "--stdin" in rest:
+            spec = json.load(stdin or sys.stdin)
+        else:
+            with open(resolve_path(positionals(rest)[0], cwd)) as f:
+                spec = json.load(f)
+    durability = get_arg(rest, "--durability")
+    if durability:
+        spec["durability"] = durability
+    line_ending = get_arg(rest, "--line-ending")
+    if line_ending:
+        spec["line_ending"] = line_ending
+    if "--skip-unchanged" in rest:
+        spec["skip_unchanged"] = True
+    return resolve_spec(spec, cwd)
+
+
+def run(args, stdin=None, cwd=None, env=None):
+    """
+    Execute one command and return its result dict.
+
+    Args:
+        args: Command line arguments (without the program name)
+        stdin: File-like object used for --stdin (defaults to sys.stdin)
+        cwd: Directory relative paths are resolved against (defaults to os.getcwd())
+        env: The caller's FAST_EDIT_* variables, read instead of os.environ
+             (see settings; the daemon passes each client's own)
+
+    With --timings (or FAST_EDIT_TIMINGS=1) the result gets a "timings"
+    object; with --profile PATH cProfile stats of the command are written
+    to PATH. Raises on failure; callers turn exceptions into the error JSON.
+    """
+    import settings
+    with settings.using(env):
+        return _run(args, stdin, cwd)
+
+
+def _run(args, stdin=None, cwd=None):
+    import timings
+    profile = get_arg(args, "--profile")
+    timed = timings.enabled("--timings" in args)
+    if profile is None and not timed:
+        return execute(args, stdin, cwd)
     
+    with timings.record(timed) as recorder:
+        if profile is None:
+            result = execute(args, stdin, cwd)
+        else:
+            import cProfile
+            profile = resolve_path(profile, cwd)
+            profiler = cProfile.Profile()
+            try:
+                result = profiler.runcall(execute, args, stdin, cwd)
+            finally:
+                profiler.dump_stats(profile)
+    if recorder is not None:
+        result["timings"] = recorder.result()
+    if profile is not None:
+        result["profile"] = profile
+    return result
+
+
+def execute(args, stdin=None, cwd=None):
+    """Dispatch one command (see run)."""
     cmd = args[0]
     rest = args[1:]
+    durability = get_arg(rest, "--durability")
+    skip_unchanged = True if "--skip-unchanged" in rest else None
+    line_ending = get_arg(rest, "--line-ending")
     
-    try:
-        # Show lines
-        if cmd == "show" and len(rest) >= 3:
-            result = edit.show(rest[0], int(rest[1]), int(rest[2]))
-        
-        # Replace lines
-        elif cmd == "replace" and len(rest) >= 4:
-            result = edit.replace(
-                rest[0], int(rest[1]), int(rest[2]), 
-                parse_content(rest[3])
-            )
-        
-        # Insert after line
-        elif cmd == "insert" and len(rest) >= 3:
-            result = edit.insert(rest[0], int(rest[1]), parse_content(rest[2]))
-        
-        # Delete lines
-        elif cmd == "delete" and len(rest) >= 3:
-            result = edit.delete(rest[0], int(rest[1]), int(rest[2]))
-        
-        # Batch edit
-        elif cmd == "batch":
-            if "--stdin" in rest:
-                spec = json.load(sys.stdin)
-            else:
-                spec = json.load(open(rest[0]))
-            result = edit.batch(spec)
-        
-        # Paste from clipboard/stdin
-        elif cmd == "paste" and rest:
-            filepath = [x for x in rest if not x.startswith("--")][0]
-            encoding = "base64" if "--base64" in rest else None
-            result = paste.paste(
-                filepath,
-                from_stdin="--stdin" in rest,
-                extract="--extract" in rest,
-                encoding=encoding
-            )
-        
-        # Write files from JSON
-        elif cmd == "write":
-            if "--stdin" in rest:
-                spec = json.load(sys.stdin)
+    # Show lines
+    if cmd == "show" and len(rest) >= 3:
+        import edit
+        result = edit.show(
+            resolve_path(rest[0], cwd), int(rest[1]), int(rest[2]),
+            total="--total" in rest, hashes="--hashes" in rest
+        )
+    
+    # Find lines
+    elif cmd in ("grep", "find-lines") and len(positionals(rest)) >= 2:
+        import edit
+        pattern, *files = positionals(rest)
+        context = get_arg(rest, "--context")
+        max_count = get_arg(rest, "--max-count")
+        result = edit.grep(
+            [resolve_path(f, cwd) for f in files], pattern,
+            regex="--regex" in rest,
+            ignore_case="--ignore-case" in rest,
+            context=int(context) if context else 0,
+            max_count=int(max_count) if max_count else None,
+        )
+    
+    # Replace lines
+    elif cmd == "replace" and len(rest) >= 4:
+        import edit
+        result = edit.replace(
+            resolve_path(rest[0], cwd), int(rest[1]), int(rest[2]), 
+            parse_content(rest[3]), durability=durability,
+            expect=get_arg(rest, "--expect"), line_ending=line_ending
+        )
+    
+    # Insert after line
+    elif cmd == "insert" and len(rest) >= 3:
+        import edit
+        result = edit.insert(
+            resolve_path(rest[0], cwd), int(rest[1]), parse_content(rest[2]),
+            durability=durability, expect=get_arg(rest, "--expect"),
+            line_ending=line_ending
+        )
+    
+    # Delete lines
+    elif cmd == "delete" and len(rest) >= 3:
+        import edit
+        result = edit.delete(
+            resolve_path(rest[0], cwd), int(rest[1]), int(rest[2]),
+            durability=durability, expect=get_arg(rest, "--expect"),
+            line_ending=line_ending
+        )
+    
+    # Batch edit
+    elif cmd == "batch":
+        import edit
+        result = edit.batch(load_spec(rest, stdin, cwd))
+    
+    # Paste from clipboard/stdin
+    elif cmd == "paste" and rest:
+        import paste
+        filepath = positionals(rest)[0]
+        encoding = "base64" if "--base64" in rest else None
+        result = paste.paste(
+            resolve_path(filepath, cwd),
+            from_stdin="--stdin" in rest,
+            extract="--extract" in rest,
+            encoding=encoding,
+            stdin=stdin,
+            durability=durability,
+            line_ending=line_ending,
+            skip_unchanged=skip_unchanged,
+        )
+    
+    # Write files from JSON
+    elif cmd == "write":
+        import paste
+        result = paste.write(load_spec(rest, stdin, cwd))
+    
+    # Type check
+    elif cmd == "check" and rest:
+        import check
+        files = [resolve_path(f, cwd) for f in positionals(rest)]
+        checker = get_arg(rest, "--checker")
+        checkers = checker.split(",") if checker else None
+        batch_spec = get_arg(rest, "--from-batch")
+        if batch_spec:
+            # Check exactly the files a batch spec touches ("-" = spec on stdin)
+            if batch_spec == "-":
+                spec = json.load(stdin or sys.stdin)
             else:
-                spec = json.load(open(rest[0]))
-            result = paste.write(spec)
-        
-        # Type check
-        elif cmd == "check" and rest:
-            filepath = [x for x in rest if not x.startswith("--")][0]
-            checker = get_arg(rest, "--checker")
-            result = check.check(filepath, checker)
-        
-        # Save pasted content from OpenCode storage
-        elif cmd == "save-pasted" and rest:
-            filepath = [x for x in rest if not x.startswith("--")][0]
-            min_lines_str = get_arg(rest, "--min-lines")
-            min_lines = int(min_lines_str) if min_lines_str else 20
-            msg_id = get_arg(rest, "--msg-id")
-            nth_str = get_arg(rest, "--nth")
-            nth = int(nth_str) if nth_str else 1
-            result = pasted.save_pasted(
-                filepath,
-                min_lines=min_lines,
-                msg_id=msg_id,
-                extract="--extract" in rest,
-                nth=nth,
-            )
-        
+                with open(resolve_path(batch_spec, cwd)) as f:
+                    spec = json.load(f)
+            spec = resolve_spec(spec, cwd)
+            files += [fs["file"] for fs in spec.get("files", [spec])]
+        lines = get_arg(rest, "--lines")
+        context = get_arg(rest, "--context")
+        options = dict(
+            cold="--cold" in rest,
+            cache="--no-cache" not in rest,
+            precheck="--no-precheck" not in rest,
+            lines=parse_ranges(lines) if lines else None,
+            since_edit="--since-edit" in rest,
+            context=int(context) if context else 0,
+        )
+        if len(files) == 1 and not batch_spec and (not checkers or len(checkers) == 1):
+            result = check.check(files[0], checker, **options)
         else:
-            result = {"status": "error", "message": f"Unknown command: {cmd}"}
-        
+            result = check.check_files(files, checkers, **options)
+    
+    # Save pasted content from OpenCode storage
+    elif cmd == "save-pasted" and rest:
+        import pasted
+        filepath = positionals(rest)[0]
+        min_lines_str = get_arg(rest, "--min-lines")
+        min_lines = int(min_lines_str) if min_lines_str else 20
+        msg_id = get_arg(rest, "--msg-id")
+        nth_str = get_arg(rest, "--nth")
+        nth = int(nth_str) if nth_str else 1
+        result = pasted.save_pasted(
+            resolve_path(filepath, cwd),
+            min_lines=min_lines,
+            msg_id=msg_id,
+            extract="--extract" in rest,
+            nth=nth,
+            durability=durability,
+            line_ending=line_ending,
+            skip_unchanged=skip_unchanged,
+        )
+    
+    # Undo journal
+    elif cmd in ("undo", "redo", "log"):
+        import journal
+        paths = positionals(rest)
+        path = resolve_path(paths[0], cwd) if paths else cwd
+        if cmd == "log":
+            limit = get_arg(rest, "--limit")
+            result = journal.log(path, limit=int(limit) if limit else 20)
+        else:
+            result = getattr(journal, cmd)(path, durability=durability)
+    
+    else:
+        result = {"status": "error", "message": f"Unknown command: {cmd}"}
+    
+    if cmd in ("replace", "insert", "batch") and result.get("status") == "ok":
+        attach_syntax(result, "--syntax-check" in rest)
+    
+    return result
+
+
+def attach_syntax(result, flag=False):
+    """Add the in-process syntax pre-check of edited .py files to an edit result."""
+    import syntax
+    if not syntax.auto_enabled(flag):
+        return
+    entries = result.get("results", [result])
+    paths = [entry["file"] for entry in entries if syntax.is_python(entry["file"])]
+    import timings
+    with timings.phase("syntax_check"):
+        found = syntax.check_files(paths)
+    for entry in entries:
+        if entry["file"] in found:
+            entry["syntax"] = found[entry["file"]]
+
+
+def error_result(exc):
+    """Build the error JSON for an exception raised by run()."""
+    result = {"status": "error", "message": str(exc)}
+    stale = getattr(exc, "stale", None)
+    if stale:
+        result["stale"] = stale
+    return result
+
+
+def emit(result, ok=True):
+    """Print a result the way the CLI always has: pretty on stdout, compact errors on stderr."""
+    if ok:
         print(json.dumps(result, indent=2, ensure_ascii=False))
-        
+    else:
+        print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+
+
+STARTUP_PROFILE_ENV = "FAST_EDIT_STARTUP_PROFILE"
+
+
+def startup_profile(args):
+    """
+    Re-run a command in a fresh interpreter under `-X importtime`.
+    The command's own output is passed through unchanged; the import
+    breakdown is printed to stderr as JSON.
+    """
+    import subprocess
+    import time
+    
+    env = dict(os.environ)
+    env.pop(STARTUP_PROFILE_ENV, None)
+    cmd = [sys.executable, "-X", "importtime", os.path.abspath(__file__)] + args
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    wall_ms = (time.perf_counter() - t0) * 1000
+    
+    imports = []
+    passthrough = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            passthrough.append(line)
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # column header
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append({
+            "module": name.strip(),
+            "depth": depth,
+            "self_us": self_us,
+            "cumulative_us": cumulative_us,
+        })
+    
+    sys.stdout.write(proc.stdout)
+    if passthrough:
+        print("\n".join(passthrough), file=sys.stderr)
+    
+    top_level = sorted(
+        (i for i in imports if i["depth"] == 0),
+        key=lambda i: -i["cumulative_us"]
+    )
+    profile = {
+        "command": args[0] if args else None,
+        "wall_ms": round(wall_ms, 3),
+        "import_us": sum(i["self_us"] for i in imports),
+        "modules": len(imports),
+        "imports": top_level,
+    }
+    print(json.dumps({"startup_profile": profile}, indent=2), file=sys.stderr)
+    sys.exit(proc.returncode)
+
+
+def main(argv=None, stdin=None):
+    args = sys.argv[1:] if argv is None else argv
+    
+    if "--startup-profile" in args or os.environ.get(STARTUP_PROFILE_ENV):
+        startup_profile([a for a in args if a != "--startup-profile"])
+    
+    if not args:
+        print(__doc__)
+        sys.exit(0)
+    
+    # Long-running server mode (see daemon.py)
+    if args[0] == "serve":
+        import daemon
+        idle = get_arg(args, "--idle-timeout")
+        daemon.serve(
+            socket_path=get_arg(args, "--socket"),
+            idle_timeout=float(idle) if idle else daemon.DEFAULT_IDLE_TIMEOUT,
+        )
+        return
+    
+    try:
+        result = run(args, stdin=stdin)
     except Exception as e:
-        error = {"status": "error", "message": str(e)}
-        print(json.dumps(error, ensure_ascii=False), file=sys.stderr)
+        emit(error_result(e), ok=False)
         sys.exit(1)
+    
+    emit(result)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+fe_client — thin client for the fast-edit daemon.
+
+Forwards argv (and stdin for commands that read it) to a running
+`fast_edit.py serve` over a Unix domain socket and prints the same JSON
+the CLI would. Falls back to in-process execution when no daemon is
+listening, so it is always safe to use in place of fast_edit.py.
+
+Only os/sys/json/socket and settings are imported here; the editing modules are loaded
+lazily on the fallback path.
+"""
+import os
+import sys
+import json
+import socket
+
+import settings
+
+
+def default_socket_path():
+    """Socket path: $FAST_EDIT_SOCKET, else a per-user socket in the runtime dir."""
+    env = os.environ.get("FAST_EDIT_SOCKET")
+    if env:
+        return env
+    base = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(base, f"fast-edit-{uid}.sock")
+
+
+def reads_stdin(argv):
+    """Whether a command takes input from stdin: --stdin, or check --from-batch -."""
+    if "--stdin" in argv:
+        return True
+    try:
+        return argv[argv.index("--from-batch") + 1] == "-"
+    except (ValueError, IndexError):
+        return False
+
+
+def connect(socket_path=None):
+    """Connect to the daemon, or return None if none is listening."""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path or default_socket_path())
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def request(message, socket_path=None):
+    """
+    Send one JSON message to the daemon and return its JSON response.
+    Returns None if no daemon is running (nothing was sent).
+    """
+    sock = connect(socket_path)
+    if sock is None:
+        return None
+    with sock:
+        sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("fast-edit daemon closed the connection")
+    return json.loads(line)
+
+
+def run_local(argv, stdin_text=None):
+    """Fallback: execute in this process exactly like fast_edit.py would."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    import fast_edit
+    stdin = None
+    if stdin_text is not None:
+        import io
+        stdin = io.StringIO(stdin_text)
+    fast_edit.main(argv, stdin=stdin)
+
+
+def main():
+    argv = sys.argv[1:]
+
+    if not argv or argv[0] == "serve":
+        run_local(argv)
+        return
+
+    stdin_text = sys.stdin.read() if reads_stdin(argv) else None
+    response = request({
+        "op": "run",
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "stdin": stdin_text,
+        "env": settings.caller_env(),
+    })
+
+    if response is None:
+        run_local(argv, stdin_text)
+        return
+
+    if response["code"] == 0:
+        print(json.dumps(response["result"], indent=2, ensure_ascii=False))
+    else:
+        print(json.dumps(response["result"], ensure_ascii=False), file=sys.stderr)
+    sys.exit(response["code"])
+
+
+if __name__ == "__main__":
+    main()
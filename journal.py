@@ -0,0 +1,423 @@
+"""
+Undo journal: reverse deltas of every edit, for undo / redo / log.
+
+There is one append-only journal per repository (the nearest directory
+holding .git, else the edited file's directory), kept under
+FAST_EDIT_JOURNAL_DIR (default: $XDG_STATE_HOME/fast-edit/journal). An entry
+is one JSON header line followed by its payload: for each changed byte
+range, the old bytes then the new bytes. A command appends one entry however
+many ranges or files it touched. Undo and redo read and verify only those
+ranges and append a marker entry instead of rewriting the journal. Once a
+journal would outgrow FAST_EDIT_JOURNAL_MAX bytes, its oldest entries are
+evicted.
+
+Set FAST_EDIT_JOURNAL=off to disable journaling.
+"""
+import os
+import json
+import time
+import _thread
+
+import settings
+from core import (
+    prepare_temp, prepare_splice, commit_temp, commit_all, discard_temp, read_ref,
+    copy_range, state_dir, _write_all
+)
+
+
+JOURNAL_ENV = "FAST_EDIT_JOURNAL"
+JOURNAL_DIR_ENV = "FAST_EDIT_JOURNAL_DIR"
+JOURNAL_MAX_ENV = "FAST_EDIT_JOURNAL_MAX"
+DEFAULT_MAX = 64 << 20
+
+_lock = _thread.allocate_lock()
+_roots = {}
+
+
+def enabled():
+    """Whether edits are journaled (FAST_EDIT_JOURNAL=off disables it)."""
+    return settings.get(JOURNAL_ENV, "").lower() not in ("0", "off", "false", "no")
+
+
+def _max_size():
+    value = settings.get(JOURNAL_MAX_ENV)
+    return int(value) if value else DEFAULT_MAX
+
+
+def keepable(size):
+    """Whether an entry with size bytes of payload is small enough to be journaled."""
+    return size <= _max_size() // 2
+
+
+def find_root(path):
+    """Repository root of path (nearest ancestor holding .git), else its directory."""
+    abs_path = os.path.abspath(path)
+    directory = abs_path if os.path.isdir(abs_path) else os.path.dirname(abs_path)
+    root = _roots.get(directory)
+    if root is None:
+        root = candidate = directory
+        while True:
+            if os.path.exists(os.path.join(candidate, ".git")):
+                root = candidate
+                break
+            parent = os.path.dirname(candidate)
+            if parent == candidate:
+                break
+            candidate = parent
+        _roots[directory] = root
+    return root
+
+
+def journal_path(root):
+    """Journal file for a root directory."""
+    from zlib import crc32
+    base = settings.get(JOURNAL_DIR_ENV) or state_dir("journal")
+    name = f"{os.path.basename(root) or 'root'}-{crc32(root.encode('utf-8')):08x}.log"
+    return os.path.join(base, name)
+
+
+def read_span(filepath, begin, end):
+    """Bytes [begin, end) of a file."""
+    with open(filepath, "rb") as f:
+        f.seek(begin)
+        return f.read(end - begin)
+
+
+def delta(filepath, segments, size):
+    """
+    Hunks (offset, old bytes, new bytes) of a core.prepare_splice layout of
+    filepath, in original-file coordinates: whatever lies between the
+    ranges it copies from the original.
+    """
+    hunks = []
+    cursor = 0
+    pending = []
+    with open(filepath, "rb") as f:
+        for segment in [*segments, (size, size)]:
+            if isinstance(segment, tuple) and len(segment) == 2:
+                begin, end = segment
+                if begin > cursor or pending:
+                    f.seek(cursor)
+                    hunks.append((cursor, f.read(begin - cursor), b"".join(pending)))
+                    pending = []
+                cursor = max(cursor, end)
+            elif isinstance(segment, tuple):
+                path, begin, end = segment
+                pending.append(read_ref({"path": path, "begin": begin, "end": end}))
+            elif segment:
+                pending.append(segment)
+    return hunks
+
+
+def snapshot(filepath):
+    """Current bytes of a file about to be overwritten, or None if it does not exist."""
+    try:
+        with open(filepath, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def whole_file(filepath, old, new):
+    """Change record for a whole-file write (old=None: the file was created)."""
+    return {
+        "path": os.path.abspath(filepath),
+        "size": len(old or b""),
+        "created": old is None,
+        "hunks": [(0, old or b"", new)],
+    }
+
+
+def record(op, changes):
+    """
+    Journal one command. changes: [{"path", "size" (before), "hunks":
+    [(offset, old, new), ...], "created": bool}]. Best effort: a journal
+    that cannot be written never fails the edit itself.
+    """
+    if not enabled() or not changes:
+        return
+    groups = {}
+    for change in changes:
+        groups.setdefault(journal_path(find_root(change["path"])), []).append(change)
+
+    for path, group in groups.items():
+        files = []
+        payload = []
+        for change in group:
+            hunks = []
+            size_after = change["size"]
+            for offset, old, new in change["hunks"]:
+                hunks.append([offset, len(old), len(new)])
+                payload += (old, new)
+                size_after += len(new) - len(old)
+            files.append({
+                "path": change["path"],
+                "created": change.get("created", False),
+                "size_before": change["size"],
+                "size_after": size_after,
+                "hunks": hunks,
+            })
+        try:
+            _append(path, {"kind": "edit", "op": op, "files": files}, b"".join(payload))
+        except OSError:
+            pass
+
+
+def _append(path, header, payload=b""):
+    """Append one entry, evicting the oldest ones if the journal would grow too large."""
+    header = dict(header, id=time.time_ns(), time=round(time.time(), 3), payload=len(payload))
+    data = json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n" + payload
+    limit = _max_size()
+    if len(data) > limit // 2:
+        return False  # too large to keep; this edit cannot be undone
+
+    with _lock:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            size = 0
+        if size + len(data) > limit:
+            _evict(path, limit // 2 - len(data))
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            _write_all(fd, data)
+        finally:
+            os.close(fd)
+    return True
+
+
+def _entries(path):
+    """[(header, payload offset, entry offset, entry end)] of a journal, oldest first."""
+    entries = []
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return entries
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        while True:
+            start = f.tell()
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                break
+            try:
+                header = json.loads(line)
+            except ValueError:
+                break  # torn tail from an interrupted append
+            payload_at = f.tell()
+            end = payload_at + header.get("payload", 0)
+            if end > size:
+                break
+            f.seek(end)
+            entries.append((header, payload_at, start, end))
+    return entries
+
+
+def _evict(path, keep):
+    """Rewrite the journal keeping only its newest entries that fit in keep bytes."""
+    entries = _entries(path)
+    first = len(entries)
+    used = 0
+    while first > 0 and used + entries[first - 1][3] - entries[first - 1][2] <= keep:
+        first -= 1
+        used += entries[first][3] - entries[first][2]
+
+    with open(path, "rb") as src:
+        def fill(fd):
+            if first < len(entries):
+                begin = entries[first][2]
+                copy_range(src.fileno(), fd, begin, entries[-1][3] - begin)
+
+        tmp_path = prepare_temp(path, fill, durability="none")
+    commit_temp(tmp_path, path, durability="none")
+
+
+def _state(entries):
+    """Replay a journal: edits by id, ids currently applied, ids undone (redo stack)."""
+    edits = {}
+    applied = []
+    undone = []
+    for header, payload_at, _, _ in entries:
+        kind = header["kind"]
+        if kind == "edit":
+            edits[header["id"]] = (header, payload_at)
+            applied.append(header["id"])
+            undone.clear()
+        elif kind == "undo" and applied and applied[-1] == header["target"]:
+            undone.append(applied.pop())
+        elif kind == "redo" and undone and undone[-1] == header["target"]:
+            applied.append(undone.pop())
+    return edits, applied, undone
+
+
+def _apply(path, header, payload_at, reverse, durability):
+    """
+    Undo (reverse) or redo one journaled edit. Every file is verified
+    against the journal first (size, and the bytes at each changed range),
+    then all are rewritten together; anything else fails without writing.
+    """
+    command = "undo" if reverse else "redo"
+    plan = []
+    with open(path, "rb") as j:
+        j.seek(payload_at)
+        for entry in header["files"]:
+            hunks = []
+            shift = 0
+            for offset, old_len, new_len in entry["hunks"]:
+                old, new = j.read(old_len), j.read(new_len)
+                if reverse:
+                    hunks.append((offset + shift, new, old))
+                    shift += new_len - old_len
+                else:
+                    hunks.append((offset, old, new))
+            plan.append((entry, hunks))
+
+    def stale(filepath):
+        return ValueError(
+            f"{command}: {filepath} changed since {header['op']} #{header['id']}; nothing written"
+        )
+
+    # Verify every file before touching any
+    removals = []
+    for entry, hunks in plan:
+        filepath = entry["path"]
+        expected_size = entry["size_after"] if reverse else entry["size_before"]
+        exists = os.path.exists(filepath)
+        if entry["created"] and not reverse:
+            if exists:
+                raise stale(filepath)
+            continue
+        if not exists or os.path.getsize(filepath) != expected_size:
+            raise stale(filepath)
+        with open(filepath, "rb") as f:
+            for pos, current, _ in hunks:
+                f.seek(pos)
+                if f.read(len(current)) != current:
+                    raise stale(filepath)
+        if entry["created"]:
+            removals.append(filepath)
+
+    prepared = []
+    try:
+        for entry, hunks in plan:
+            filepath = entry["path"]
+            if filepath in removals:
+                continue
+            if entry["created"]:
+                data = hunks[0][2]
+                tmp_path = prepare_temp(filepath, lambda fd: _write_all(fd, data), durability=durability)
+            else:
+                segments = []
+                cursor = 0
+                for pos, current, replacement in hunks:
+                    segments += [(cursor, pos), replacement]
+                    cursor = pos + len(current)
+                segments.append((cursor, os.path.getsize(filepath)))
+                tmp_path = prepare_splice(filepath, segments, durability)
+            prepared.append((tmp_path, filepath))
+    except Exception:
+        for tmp_path, _ in prepared:
+            discard_temp(tmp_path)
+        raise
+    commit_all(prepared, durability)
+    for filepath in removals:
+        os.remove(filepath)
+
+    import lineindex
+    for entry, _ in plan:
+        lineindex.invalidate(entry["path"])
+
+
+def _undo_redo(path, reverse, durability):
+    command = "undo" if reverse else "redo"
+    root = find_root(path or os.getcwd())
+    jpath = journal_path(root)
+    with _lock:
+        edits, applied, undone = _state(_entries(jpath))
+    stack = applied if reverse else undone
+    if not stack:
+        raise ValueError(f"{command}: nothing to {command} in {root}")
+
+    header, payload_at = edits[stack[-1]]
+    _apply(jpath, header, payload_at, reverse, durability)
+    _append(jpath, {"kind": command, "op": header["op"], "target": header["id"]})
+
+    return {
+        "status": "ok",
+        command: header["id"],
+        "op": header["op"],
+        "files": [entry["path"] for entry in header["files"]],
+        "remaining": len(stack) - 1,
+    }
+
+
+def undo(path=None, durability=None):
+    """Revert the most recent applied edit journaled for path's root (default: cwd)."""
+    return _undo_redo(path, True, durability)
+
+
+def redo(path=None, durability=None):
+    """Re-apply the most recently undone edit (cleared by any new edit)."""
+    return _undo_redo(path, False, durability)
+
+
+def last_edit_ranges(filepath):
+    """
+    Line ranges [(start, end)] of filepath, as it is now, written by its most
+    recent applied journaled edit. None if there is no such edit or the
+    file has changed size since.
+    """
+    abs_path = os.path.abspath(filepath)
+    edits, applied, _ = _state(_entries(journal_path(find_root(abs_path))))
+    for edit_id in reversed(applied):
+        header, _ = edits[edit_id]
+        for entry in header["files"]:
+            if entry["path"] != abs_path:
+                continue
+            if not os.path.exists(abs_path) or os.path.getsize(abs_path) != entry["size_after"]:
+                return None
+            import lineindex
+            index = lineindex.get_index(abs_path)
+            ranges = []
+            shift = 0
+            for offset, old_len, new_len in entry["hunks"]:
+                begin = offset + shift
+                shift += new_len - old_len
+                first = index.line_at(begin)
+                last = index.line_at(begin + new_len - 1) if new_len else first
+                ranges.append((max(first, 1), max(last, 1)))
+            return ranges
+    return None
+
+
+def log(path=None, limit=20):
+    """List the journaled edits for path's root (default: cwd), newest first."""
+    root = find_root(path or os.getcwd())
+    jpath = journal_path(root)
+    edits, applied, undone = _state(_entries(jpath))
+    active = set(applied)
+
+    entries = []
+    for edit_id in reversed(list(edits)):
+        if limit and len(entries) >= limit:
+            break
+        header, _ = edits[edit_id]
+        entries.append({
+            "id": edit_id,
+            "op": header["op"],
+            "time": header["time"],
+            "files": [entry["path"] for entry in header["files"]],
+            "bytes": header["payload"],
+            "state": "applied" if edit_id in active else "undone",
+        })
+
+    return {
+        "status": "ok",
+        "root": root,
+        "journal": jpath,
+        "edits": len(edits),
+        "undo": len(applied),
+        "redo": len(undone),
+        "entries": entries,
+    }
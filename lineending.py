@@ -0,0 +1,207 @@
+"""
+Line endings of edited files: detection, caching and normalization.
+
+A file's style is its dominant line ending (LF or CRLF) and whether it
+starts with a UTF-8 BOM. It is detected from a bounded sample (the first
+and last SAMPLE_SIZE bytes) and cached per file fingerprint, so large
+files are never scanned for it. New text is normalized with bulk string
+operations instead of a loop over its lines; a lone CR in it is a line
+break like LF and CRLF. (Line numbers count LF, so a file using lone CRs
+throughout is a single line.)
+
+Modes (--line-ending, "line_ending" in a batch spec, or FAST_EDIT_LINE_ENDING):
+    auto      new lines get the file's dominant ending (default)
+    lf, crlf  new lines get that ending
+    preserve  each new line takes the ending of the line it replaces (extra
+              lines that of the last replaced line, inserted lines that of
+              the line before them), and a BOM stays at the start of the file
+"""
+import os
+import _thread
+from array import array
+from collections import OrderedDict
+
+import settings
+from lineindex import LineIndex, fingerprint
+
+
+LINE_ENDING_ENV = "FAST_EDIT_LINE_ENDING"
+MODES = ("auto", "lf", "crlf", "preserve")
+ENDINGS = {"lf": "\n", "crlf": "\r\n"}
+SAMPLE_SIZE = 1 << 16
+BOM = b"\xef\xbb\xbf"
+MAX_CACHED = 256
+
+_cache = OrderedDict()  # abs path -> (fingerprint, (line ending, has BOM))
+_lock = _thread.allocate_lock()
+
+
+def line_ending_mode(mode=None):
+    """Resolve the mode: explicit value, else $FAST_EDIT_LINE_ENDING, else "auto"."""
+    mode = mode or settings.get(LINE_ENDING_ENV) or "auto"
+    if mode not in MODES:
+        raise ValueError(f"line ending must be one of: {', '.join(MODES)}")
+    return mode
+
+
+def dominant(data, complete=False):
+    """
+    Dominant line ending of a bytes sample: CRLF if more than half of its
+    lines end with it, else LF. complete: data is the whole file, so an
+    unterminated last line counts as a line.
+    """
+    lf = data.count(b"\n")
+    if not lf:
+        return "\n"
+    lines = lf + (1 if complete and not data.endswith(b"\n") else 0)
+    return "\r\n" if data.count(b"\r\n") > lines // 2 else "\n"
+
+
+def file_style(filepath):
+    """(dominant line ending, starts with a BOM) of a file; cached per fingerprint."""
+    abs_path = os.path.abspath(filepath)
+    with open(abs_path, "rb") as f:
+        fp = fingerprint(os.fstat(f.fileno()))
+        with _lock:
+            entry = _cache.get(abs_path)
+        if entry is not None and entry[0] == fp:
+            return entry[1]
+        size = fp[1]
+        if size <= 2 * SAMPLE_SIZE:
+            head = f.read()
+            eol = dominant(head, complete=True)
+        else:
+            head = f.read(SAMPLE_SIZE)
+            f.seek(size - SAMPLE_SIZE)
+            # The separator keeps a CR at the end of head from pairing with tail
+            eol = dominant(head + b"\0" + f.read(SAMPLE_SIZE))
+    style = (eol, head.startswith(BOM))
+    with _lock:
+        _cache[abs_path] = (fp, style)
+        _cache.move_to_end(abs_path)
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+    return style
+
+
+def normalize(text, eol):
+    """
+    text with every CRLF, lone CR and LF turned into eol, terminated by one
+    ("" stays ""). Other characters str.splitlines() breaks on are kept as is.
+    """
+    if not text:
+        return ""
+    if "\r" in text:
+        cr = text.count("\r")
+        if eol == "\r\n" and cr == text.count("\n") == text.count("\r\n"):
+            # Already CRLF throughout: counting is much cheaper than replacing
+            return text if text.endswith("\n") else text + eol
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    if not text.endswith("\n"):
+        text += "\n"
+    if eol != "\n":
+        text = text.replace("\n", eol)
+    return text
+
+
+def with_endings(text, endings, fallback):
+    """
+    LF-normalized text with its i-th line ending in endings[i] (lines beyond
+    take the last one); "" entries (unterminated lines) become fallback.
+    """
+    endings = [e or fallback for e in endings] or [fallback]
+    if len(set(endings)) == 1:
+        return text if endings[0] == "\n" else text.replace("\n", endings[0])
+    lines = text.split("\n")[:-1]
+    if len(lines) > len(endings):
+        endings += [endings[-1]] * (len(lines) - len(endings))
+    return "".join(map(str.__add__, lines, endings))
+
+
+def line_endings(filepath, index, start, end):
+    """Endings ("\\r\\n", "\\n", or "" if unterminated) of lines start..end."""
+    offsets = index.offsets
+    begin = offsets[start - 1]
+    with open(filepath, "rb") as f:
+        f.seek(begin)
+        data = f.read(offsets[end] - begin)
+    endings = []
+    for i in range(start, end + 1):
+        stop = offsets[i] - begin
+        if data[stop - 2:stop] == b"\r\n":
+            endings.append("\r\n")
+        elif data[stop - 1:stop] == b"\n":
+            endings.append("\n")
+        else:
+            endings.append("")
+    return endings
+
+
+class Preserve:
+    """New-text line endings in preserve mode, taken from the lines around the edit."""
+
+    def __init__(self, filepath, index, fallback, bom):
+        self.filepath = filepath
+        self.index = index
+        self.fallback = fallback
+        self.bom = bom
+
+    def _source(self, first, last):
+        """Original lines whose endings an edit of lines first..last reuses."""
+        if last < first:  # insertion after line last (0 = prepend): its neighbour
+            last = first = last or 1
+        if first > self.index.total:
+            return None
+        return first, last
+
+    def uniform(self, first, last):
+        """The single ending an edit of first..last gets whatever its length, else None."""
+        source = self._source(first, last)
+        if source is None:
+            return self.fallback
+        found = {e or self.fallback for e in line_endings(self.filepath, self.index, *source)}
+        return found.pop() if len(found) == 1 else None
+
+    def text(self, text, first, last):
+        """text normalized to replace lines first..last (last = first - 1: inserted)."""
+        if self.bom and first == 1:
+            text = text.removeprefix("\ufeff")
+        text = normalize(text, "\n")
+        source = self._source(first, last)
+        count = text.count("\n")
+        if source is None or not count:
+            return with_endings(text, [], self.fallback)
+        a, b = source
+        return with_endings(text, line_endings(self.filepath, self.index, a, min(b, a + count - 1)),
+                            self.fallback)
+
+
+def without_bom(index):
+    """
+    Copy of index whose line 1 starts after the BOM, so edits never move or
+    drop it: in preserve mode the BOM stays in front of whatever replaces line 1.
+    """
+    offsets = array("Q", index.offsets)
+    offsets[0] = len(BOM)
+    return LineIndex(offsets)
+
+
+def with_bom(index):
+    """Inverse of without_bom() for an index derived from one: the BOM joins line 1."""
+    offsets = index.offsets
+    if len(offsets) > 1 and offsets[-1] == offsets[-2]:
+        offsets = offsets[:-1]  # line 1 held only the BOM and was moved past
+    if len(offsets) == 1:
+        return LineIndex(array("Q", [0, offsets[0]]))
+    offsets[0] = 0
+    return LineIndex(offsets)
+
+
+def prefixed(index):
+    """Index of output rendered without the BOM, once the BOM is written in front."""
+    offsets = index.offsets
+    if len(offsets) > 1 and offsets[-1] == offsets[-2]:
+        offsets = offsets[:-1]  # line 1 held only the BOM and was copied after the edits
+    if len(offsets) == 1:
+        return LineIndex(array("Q", [0, len(BOM)]))
+    return LineIndex(array("Q", [0, *map(len(BOM).__add__, offsets[1:])]))
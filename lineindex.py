@@ -0,0 +1,252 @@
+"""
+Line-offset index: the byte offset of every line start in a file.
+
+offsets[i] is where line i+1 starts and offsets[-1] is the file size, so
+the byte span of lines START..END is offsets[START-1]:offsets[END] without
+scanning. Indexes are cached in memory (for the daemon) keyed by the file's
+fingerprint (inode, size, mtime_ns), and optionally persisted as sidecar
+files when FAST_EDIT_INDEX_DIR is set. Edits splice the index instead of
+rebuilding it.
+"""
+import os
+import _thread
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+
+import settings
+from core import split_lines
+
+
+INDEX_DIR_ENV = "FAST_EDIT_INDEX_DIR"
+MAX_CACHED = 64
+# Small files are cheaper to rescan than to load a sidecar for
+SIDECAR_MIN_SIZE = 1 << 20
+
+_cache = OrderedDict()
+# _thread rather than threading: keeps the CLI cold start lean
+_lock = _thread.allocate_lock()
+
+
+class LineIndex:
+    """Byte offsets of line starts, plus the file size as a sentinel."""
+
+    def __init__(self, offsets):
+        self.offsets = offsets
+
+    @classmethod
+    def from_lengths(cls, lengths):
+        """Build from a sequence of line byte lengths."""
+        return cls(array("Q", accumulate(lengths, initial=0)))
+
+    @classmethod
+    def from_file(cls, f):
+        """Build by scanning a binary file object from its current position."""
+        return cls.from_lengths(map(len, f))
+
+    @property
+    def total(self):
+        """Number of lines."""
+        return len(self.offsets) - 1
+
+    @property
+    def size(self):
+        """File size in bytes."""
+        return self.offsets[-1]
+
+    def span(self, start, end):
+        """Byte range [begin, stop) of lines start..end (1-based, inclusive)."""
+        return self.offsets[start - 1], self.offsets[end]
+
+    def line_at(self, byte_offset):
+        """1-based line number containing byte_offset (binary search)."""
+        return bisect_right(self.offsets, byte_offset, 0, len(self.offsets) - 1)
+
+    def splice(self, start, end, lengths):
+        """
+        Return a new index with lines start..end replaced by lines of the
+        given byte lengths (end = start - 1 for a pure insertion).
+        """
+        offsets = self.offsets
+        base = offsets[start - 1]
+        new = array("Q", accumulate(lengths, initial=base))
+        delta = new[-1] - offsets[end]
+        result = offsets[:start - 1]
+        result.extend(new)
+        if delta:
+            result.extend(o + delta for o in offsets[end + 1:])
+        else:
+            result.extend(offsets[end + 1:])
+        return LineIndex(result)
+
+
+class IndexBuilder:
+    """
+    Builds the LineIndex of output assembled in one pass from line ranges of
+    an existing file and literal bytes, without re-reading the result.
+    """
+
+    def __init__(self):
+        self.offsets = array("Q")
+        self.pos = 0
+        self.open = False  # output currently ends mid-line
+
+    def copy(self, index, start, end, open_end=False):
+        """Append lines start..end of index; open_end if the last lacks a newline."""
+        if end < start:
+            return
+        offsets = index.offsets
+        begin = offsets[start - 1]
+        starts = offsets[start - 1:end]
+        if self.open:
+            starts = starts[1:]
+        shift = self.pos - begin
+        if shift:
+            self.offsets.extend(map(shift.__add__, starts))
+        else:
+            self.offsets.extend(starts)
+        self.pos += offsets[end] - begin
+        self.open = open_end
+
+    def write(self, data):
+        """Append literal bytes."""
+        for piece in split_lines(data):
+            if not self.open:
+                self.offsets.append(self.pos)
+            self.pos += len(piece)
+            self.open = not piece.endswith(b"\n")
+
+    def finish(self):
+        self.offsets.append(self.pos)
+        return LineIndex(self.offsets)
+
+
+def region_index(ref):
+    """
+    LineIndex (offsets relative to the span) of a core.content_ref() span,
+    taken from the source's index when known, else by scanning the span.
+    """
+    begin, end = ref["begin"], ref["end"]
+    index = ref.get("index")
+    if index is not None:
+        lo = bisect_right(index.offsets, begin) - 1
+        hi = bisect_right(index.offsets, end) - 1
+        if index.offsets[lo] == begin and index.offsets[hi] == end:
+            return LineIndex(array("Q", map((-begin).__add__, index.offsets[lo:hi + 1])))
+    
+    lengths = []
+    remaining = end - begin
+    with open(ref["path"], "rb") as f:
+        f.seek(begin)
+        for line in f:
+            if len(line) >= remaining:
+                lengths.append(remaining)
+                break
+            lengths.append(len(line))
+            remaining -= len(line)
+    return LineIndex.from_lengths(lengths)
+
+
+def fingerprint(st):
+    """Cache key component identifying one version of a file."""
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _sidecar_path(abs_path):
+    index_dir = settings.get(INDEX_DIR_ENV)
+    if not index_dir:
+        return None
+    import hashlib
+    name = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()
+    return os.path.join(index_dir, name + ".idx")
+
+
+def _load_sidecar(abs_path, fp):
+    path = _sidecar_path(abs_path)
+    if path is None or fp[1] < SIDECAR_MIN_SIZE:
+        return None
+    try:
+        with open(path, "rb") as f:
+            header = array("Q")
+            header.fromfile(f, 3)
+            if tuple(header) != fp:
+                return None
+            offsets = array("Q")
+            offsets.frombytes(f.read())
+    except (OSError, EOFError, ValueError):
+        return None
+    if not offsets or offsets[-1] != fp[1]:
+        return None
+    return LineIndex(offsets)
+
+
+def _save_sidecar(abs_path, fp, index):
+    path = _sidecar_path(abs_path)
+    if path is None or fp[1] < SIDECAR_MIN_SIZE:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{_thread.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            array("Q", fp).tofile(f)
+            index.offsets.tofile(f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # the sidecar is only an optimization
+
+
+def _remember(abs_path, fp, index):
+    with _lock:
+        _cache[abs_path] = (fp, index)
+        _cache.move_to_end(abs_path)
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+
+
+def peek(filepath):
+    """Return the cached index for the file's current version, or None."""
+    abs_path = os.path.abspath(filepath)
+    try:
+        fp = fingerprint(os.stat(abs_path))
+    except OSError:
+        return None
+    with _lock:
+        entry = _cache.get(abs_path)
+    if entry is not None and entry[0] == fp:
+        return entry[1]
+    index = _load_sidecar(abs_path, fp)
+    if index is not None:
+        _remember(abs_path, fp, index)
+    return index
+
+
+def get_index(filepath):
+    """Return the index for the file's current version, building it if needed."""
+    index = peek(filepath)
+    if index is not None:
+        return index
+    abs_path = os.path.abspath(filepath)
+    with open(abs_path, "rb") as f:
+        fp = fingerprint(os.fstat(f.fileno()))
+        index = LineIndex.from_file(f)
+    _remember(abs_path, fp, index)
+    _save_sidecar(abs_path, fp, index)
+    return index
+
+
+def store(filepath, index):
+    """Record an (incrementally updated) index for the file as it is now on disk."""
+    abs_path = os.path.abspath(filepath)
+    fp = fingerprint(os.stat(abs_path))
+    if fp[1] != index.size:
+        invalidate(filepath)
+        return
+    _remember(abs_path, fp, index)
+    _save_sidecar(abs_path, fp, index)
+
+
+def invalidate(filepath):
+    """Forget any cached index for the file."""
+    with _lock:
+        _cache.pop(os.path.abspath(filepath), None)
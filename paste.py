@@ -5,10 +5,21 @@ Paste and write operations.
 """
 import sys
 import os
-import subprocess
-import re
-import base64
-from core import write_file
+import time
+import journal
+import timings
+from lineending import ENDINGS, MODES
+from core import (
+    write_files, content_ref, read_ref, prepare_temp, commit_temp, discard_temp, unchanged,
+    skip_unchanged as skip_enabled, CHUNK_SIZE, _write_all
+)
+
+
+# Line boundaries str.splitlines() knows besides \n, \r and \r\n
+_OTHER_BREAKS = "\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+_BASE64_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+# ASCII characters b64decode() discards
+_BASE64_JUNK = bytes(sorted(set(range(128)) - set(_BASE64_ALPHABET)))
 
 
 def decode_content(content: str, encoding: str = None) -> str:
@@ -23,6 +34,7 @@ def decode_content(content: str, encoding: str = None) -> str:
         Decoded content string
     """
     if encoding == "base64":
+        import base64
         # Handle base64 with possible whitespace/newlines
         cleaned = content.strip().replace("\n", "").replace("\r", "")
         return base64.b64decode(cleaned).decode("utf-8")
@@ -31,6 +43,7 @@ def decode_content(content: str, encoding: str = None) -> str:
 
 def read_clipboard():
     """Read content from system clipboard (macOS/Linux)."""
+    import subprocess
     try:
         if sys.platform == "darwin":
             cmd = ["pbpaste"]
@@ -49,6 +62,7 @@ def extract_code_blocks(text):
     
     Regex pattern matches: ```lang\ncontent``` or ```\ncontent```
     """
+    import re
     pattern = r"```[\w]*\n?([\s\S]*?)```"
     blocks = re.findall(pattern, text)
     if blocks:
@@ -56,7 +70,281 @@ def extract_code_blocks(text):
     return text
 
 
-def paste(filepath, from_stdin=False, extract=False, encoding=None):
+def count_breaks(text):
+    """Number of line breaks in text, as str.splitlines() counts them."""
+    n = text.count("\n") + text.count("\r") - text.count("\r\n")
+    for c in _OTHER_BREAKS:
+        n += text.count(c)
+    return n
+
+
+def text_lines(text):
+    """len(text.splitlines()) without building the list."""
+    if not text:
+        return 0
+    return count_breaks(text) + (0 if text[-1] in "\n\r" + _OTHER_BREAKS else 1)
+
+
+# --- streaming pipeline ------------------------------------------------------
+# Stages are generators of str chunks. The fence extractor also yields MARK
+# and ROLLBACK: output after MARK is tentative until the next MARK, and
+# ROLLBACK drops it again.
+
+MARK = object()
+ROLLBACK = object()
+
+
+def read_chunks(stream, size=CHUNK_SIZE):
+    """Chunks of a text stream."""
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def text_chunks(text, size=CHUNK_SIZE):
+    """Chunks of a string already in memory."""
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+def _require_content(chunks):
+    """Pass chunks through; raise ValueError at the end if all were blank."""
+    blank = True
+    for chunk in chunks:
+        if blank and not chunk.isspace():
+            blank = False
+        yield chunk
+    if blank:
+        raise ValueError("No content (clipboard/stdin empty)")
+
+
+def decode_base64_chunks(chunks):
+    """
+    Incremental decode_content(..., "base64"): base64 text in, decoded text
+    out. Follows b64decode(): other ASCII characters are skipped, and so is
+    "=" unless it pads a quad, which ends the data.
+    """
+    import binascii
+    import codecs
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = b""  # data characters of the current incomplete quad
+    pads = 0
+    for chunk in chunks:
+        try:
+            data = chunk.encode("ascii")
+        except UnicodeEncodeError:
+            raise ValueError("string argument should contain only ASCII characters")
+        if pads is None:
+            continue  # padding already ended the data
+        decoded = []
+        for i, piece in enumerate(data.translate(None, _BASE64_JUNK).split(b"=")):
+            if i:  # an "=" before this piece
+                if len(pending) >= 2:
+                    pads += 1
+                    if len(pending) + pads >= 4:
+                        decoded.append(binascii.a2b_base64(pending + b"=" * pads))
+                        pending, pads = b"", None
+                        break
+            if piece:
+                pads = 0
+                piece = pending + piece
+                cut = len(piece) - len(piece) % 4
+                pending = piece[cut:]
+                if cut:
+                    decoded.append(binascii.a2b_base64(piece[:cut]))
+        text = decoder.decode(b"".join(decoded))
+        if text:
+            yield text
+    if pending:
+        binascii.a2b_base64(pending + b"=" * (pads or 0))  # raises: incomplete quad
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def unify_newlines(chunks):
+    """Turn CRLF and lone CR into LF, including pairs split across chunks."""
+    carry = ""
+    for chunk in chunks:
+        chunk = carry + chunk
+        carry = ""
+        if chunk.endswith("\r"):
+            chunk, carry = chunk[:-1], "\r"
+        if chunk:
+            yield chunk.replace("\r\n", "\n").replace("\r", "\n")
+    if carry:
+        yield "\n"
+
+
+def _fence_tail(buf, pos):
+    """Where the trailing backticks of buf[pos:] that may begin a fence finishing in the next chunk start."""
+    return max(pos, len(buf.rstrip("`")), len(buf) - 2)
+
+
+def code_block_chunks(chunks):
+    """
+    Streaming extract_code_blocks(): the contents of fenced blocks joined by
+    newlines, or the whole text if it has none. A block counts only once its
+    closing fence arrives, so its content is emitted after MARK and dropped
+    with ROLLBACK if the text ends first. Until the first block closes the
+    text is also spooled to a temporary file for the no-blocks fallback.
+    """
+    import re
+    import tempfile
+    word = re.compile(r"\w*")
+    spool = tempfile.TemporaryFile("w+", encoding="utf-8", newline="")
+    found = False
+    state = "outside"  # -> "header" (```lang) -> "body" -> "outside"
+    buf = ""
+    try:
+        for chunk in chunks:
+            if spool is not None:
+                spool.write(chunk)
+            buf += chunk
+            pos = 0
+            while True:
+                if state == "outside":
+                    i = buf.find("```", pos)
+                    if i < 0:
+                        buf = buf[_fence_tail(buf, pos):]
+                        break
+                    pos = i + 3
+                    state = "header"
+                    yield MARK
+                    if found:
+                        yield "\n"
+                elif state == "header":
+                    pos = word.match(buf, pos).end()
+                    if pos == len(buf):
+                        buf = ""  # the language tag may go on in the next chunk
+                        break
+                    if buf[pos] == "\n":
+                        pos += 1
+                    state = "body"
+                else:
+                    i = buf.find("```", pos)
+                    if i < 0:
+                        keep = _fence_tail(buf, pos)
+                        if keep > pos:
+                            yield buf[pos:keep]
+                        buf = buf[keep:]
+                        break
+                    if i > pos:
+                        yield buf[pos:i]
+                    pos = i + 3
+                    state = "outside"
+                    if not found:
+                        found = True
+                        spool.close()
+                        spool = None
+        if state != "outside":
+            yield ROLLBACK  # unclosed block
+        if not found:
+            spool.seek(0)
+            yield from read_chunks(spool)
+    finally:
+        if spool is not None:
+            spool.close()
+
+
+class _Sink:
+    """Writes pipeline output to a file descriptor, counting lines and bytes."""
+
+    def __init__(self, line_ending=None):
+        self.crlf = line_ending == "\r\n"
+        self.size = 0
+        self.breaks = 0
+        self.last = ""
+        self.mark = (0, 0, "")
+
+    def consume(self, fd, chunks):
+        for chunk in chunks:
+            if chunk is MARK:
+                self.mark = (self.size, self.breaks, self.last)
+            elif chunk is ROLLBACK:
+                self.size, self.breaks, self.last = self.mark
+                os.ftruncate(fd, self.size)
+                os.lseek(fd, self.size, os.SEEK_SET)
+            elif chunk:
+                if self.crlf:
+                    chunk = chunk.replace("\n", "\r\n")
+                self.breaks += count_breaks(chunk)
+                if self.last == "\r" and chunk[0] == "\n":
+                    self.breaks -= 1
+                self.last = chunk[-1]
+                data = chunk.encode("utf-8")
+                _write_all(fd, data)
+                self.size += len(data)
+
+    @property
+    def lines(self):
+        if not self.size:
+            return 0
+        return self.breaks + (0 if self.last in "\n\r" + _OTHER_BREAKS else 1)
+
+
+def write_stream(filepath, chunks, op, encoding=None, extract=False, line_ending=None,
+                 durability=None, skip_unchanged=None):
+    """
+    Atomically write text arriving as chunks to filepath, decoding base64,
+    extracting fenced code blocks and normalizing line endings ("lf" /
+    "crlf"; "auto" / "preserve" keep them) on the fly, so only a chunk at a time is held in memory.
+    Journaled as op. Returns (lines, bytes, unchanged): with skip_unchanged,
+    a result identical to the current file is discarded instead of renamed
+    over it.
+    """
+    if line_ending is not None and line_ending not in MODES:
+        raise ValueError(f"line ending must be one of: {', '.join(MODES)}")
+    # The content replaces the whole file, so there is no style to follow:
+    # auto and preserve keep line breaks as they arrive
+    eol = ENDINGS.get(line_ending)
+
+    old = None
+    journaled = _journaled([filepath], [0])  # the new size is known once streamed
+    if journaled:
+        with timings.phase("journal"):
+            old = journal.snapshot(filepath)
+
+    sink = _Sink(eol)
+
+    def fill(fd):
+        stream = chunks
+        if encoding == "base64":
+            stream = decode_base64_chunks(stream)
+        elif encoding is not None:
+            raise ValueError(f"unknown encoding: {encoding}")
+        if eol is not None:
+            stream = unify_newlines(stream)
+        if extract:
+            stream = code_block_chunks(stream)
+        sink.consume(fd, stream)
+
+    # Reading, decoding and writing are interleaved chunk by chunk: one phase
+    with timings.phase("stream"):
+        tmp_path = prepare_temp(filepath, fill, durability=durability)
+    timings.count("bytes_out", sink.size)
+    timings.count("lines_out", sink.lines)
+    if skip_enabled(skip_unchanged):
+        with timings.phase("compare"):
+            same = unchanged(filepath, [(tmp_path, 0, sink.size)])
+        if same:
+            discard_temp(tmp_path)
+            return sink.lines, sink.size, True
+    with timings.phase("commit"):
+        commit_temp(tmp_path, filepath, durability=durability)
+
+    if journaled and journal.keepable(len(old or b"") + sink.size):
+        with timings.phase("journal"):
+            with open(filepath, "rb") as f:
+                new = f.read()
+            journal.record(op, [journal.whole_file(filepath, old, new)])
+    return sink.lines, sink.size, False
+
+
+def paste(filepath, from_stdin=False, extract=False, encoding=None, stdin=None,
+          durability=None, line_ending=None, skip_unchanged=None):
     """
     Save content to file from clipboard or stdin.
     
@@ -65,28 +353,92 @@ def paste(filepath, from_stdin=False, extract=False, encoding=None):
         from_stdin: Read from stdin instead of clipboard
         extract: Extract code from ```...``` blocks
         encoding: Content encoding ('base64' or None)
+        stdin: Stream to read instead of sys.stdin (used by the daemon)
+        durability: "none" | "file" | "file+dir" (see core.durability_mode)
+        line_ending: "lf" | "crlf" to normalize line breaks; None, "auto" or
+            "preserve" to keep them
+        skip_unchanged: leave the file untouched if the content is identical
+            (default: $FAST_EDIT_SKIP_UNCHANGED)
+    
+    Input is processed as a stream (see write_stream): memory stays bounded
+    however large the paste.
     """
     if from_stdin:
-        content = sys.stdin.read()
+        chunks = read_chunks(stdin or sys.stdin)
     else:
         content = read_clipboard()
+        if not content:
+            raise ValueError("No content (clipboard/stdin empty)")
+        chunks = text_chunks(content)
     
-    if not content or not content.strip():
-        raise ValueError("No content (clipboard/stdin empty)")
-    
-    content = decode_content(content, encoding)
-    
-    if extract:
-        content = extract_code_blocks(content)
+    lines, size, same = write_stream(
+        filepath, _require_content(chunks), "paste", encoding=encoding, extract=extract,
+        line_ending=line_ending, durability=durability, skip_unchanged=skip_unchanged,
+    )
     
-    write_file(filepath, content)
-    
-    return {
+    result = {
         "status": "ok",
         "file": os.path.abspath(filepath),
-        "lines": len(content.splitlines()),
-        "bytes": len(content.encode("utf-8"))
+        "lines": lines,
+        "bytes": size
     }
+    if same:
+        result["unchanged"] = True
+    return result
+
+
+def _render(file_spec):
+    """
+    Decode/extract one write entry; returns its final content, or the
+    content_ref() itself when it can be copied verbatim.
+    """
+    ref = content_ref(file_spec)
+    if ref is not None:
+        if not file_spec.get("encoding") and not file_spec.get("extract", False):
+            return ref
+        raw = read_ref(ref).decode("utf-8")
+    else:
+        raw = file_spec.get("content", "")
+    content = decode_content(raw, file_spec.get("encoding"))
+    if file_spec.get("extract", False):
+        content = extract_code_blocks(content)
+    return content
+
+
+def _encoded(content):
+    """Bytes written for a write_files() content value."""
+    if isinstance(content, dict):
+        return read_ref(content)
+    return ("".join(content) if isinstance(content, list) else content).encode("utf-8")
+
+
+def _size(content):
+    """Byte size of a write_files() content value, without reading refs."""
+    if isinstance(content, dict):
+        return content["end"] - content["begin"]
+    return len(("".join(content) if isinstance(content, list) else content).encode("utf-8"))
+
+
+def _journaled(paths, sizes):
+    """
+    Whether to snapshot paths for a whole-file journal entry. The entry holds
+    both versions of every file in memory, so it is taken only if the old
+    sizes plus sizes (the new ones, as far as known before writing) fit
+    within journal.keepable(). Files are sized one by one and nothing is read
+    once the bound is exceeded.
+    """
+    if not journal.enabled():
+        return False
+    total = 0
+    for filepath, size in zip(paths, sizes):
+        try:
+            total += os.path.getsize(filepath)
+        except OSError:
+            pass  # created by this write
+        total += size
+        if not journal.keepable(total):
+            return False
+    return True
 
 
 def write(spec):
@@ -94,36 +446,77 @@ def write(spec):
     Write multiple files from JSON spec.
     Useful for zero-token file creation when user pastes content to input.
     
+    All files are written as one group (see core.write_files): temp files
+    are written concurrently and renamed together, so either every file is
+    written or none is.
+    
     JSON format:
         Single file:  {"file": "/path/to/file", "content": "...", "extract": false, "encoding": "base64"}
-        Multi file:   {"files": [{"file": "...", "content": "...", "extract": false, "encoding": "base64"}, ...]}
+        Multi file:   {"files": [{"file": "...", "content": "...", "extract": false, "encoding": "base64"}, ...],
+                       "workers": N, "durability": "none" | "file" | "file+dir",
+                       "skip_unchanged": true}
+    
+    Instead of "content", an entry may reference text on disk, which is
+    copied file-to-file (read into memory only for encoding/extract):
+        "content_file": "path"
+        "content_range": {"file": "path", "start": N, "end": M, "unit": "lines" | "bytes"}
+    
+    With "skip_unchanged" (default: $FAST_EDIT_SKIP_UNCHANGED), files whose
+    content is already identical are not rewritten and are reported with
+    "unchanged": true.
     
     Args:
         spec: JSON spec with file(s) to write
     """
+    t0 = time.perf_counter()
     file_specs = spec.get("files", [spec])
-    results = []
     
-    for file_spec in file_specs:
-        filepath = file_spec["file"]
-        content = file_spec.get("content", "")
-        encoding = file_spec.get("encoding")
-        
-        content = decode_content(content, encoding)
-        
-        if file_spec.get("extract", False):
-            content = extract_code_blocks(content)
-        
-        write_file(filepath, content)
-        
-        results.append({
-            "file": os.path.abspath(filepath),
-            "lines": len(content.splitlines()),
-            "bytes": len(content.encode("utf-8"))
-        })
+    with timings.phase("render"):
+        files = [(file_spec["file"], _render(file_spec)) for file_spec in file_specs]
+        sizes = [_size(content) for _, content in files]
+    old = None
+    if _journaled([filepath for filepath, _ in files], sizes):
+        with timings.phase("journal"):
+            old = [journal.snapshot(filepath) for filepath, _ in files]
+    with timings.phase("write"):
+        skipped = write_files(files, workers=spec.get("workers"),
+                              durability=spec.get("durability"),
+                              skip_unchanged=skip_enabled(spec.get("skip_unchanged")))
+    if old is not None:
+        with timings.phase("journal"):
+            journal.record("write", [
+                journal.whole_file(filepath, before, _encoded(content))
+                for (filepath, content), before, same in zip(files, old, skipped) if not same
+            ])
+    
+    results = []
+    total_bytes = 0
+    with timings.phase("measure"):
+        for (filepath, content), size, same in zip(files, sizes, skipped):
+            if isinstance(content, dict):
+                import lineindex
+                lines = lineindex.region_index(content).total
+            else:
+                lines = len(content.splitlines())
+            total_bytes += size
+            result = {
+                "file": os.path.abspath(filepath),
+                "lines": lines,
+                "bytes": size
+            }
+            if same:
+                result["unchanged"] = True
+            results.append(result)
+    timings.count("files", len(results))
+    timings.count("bytes_out", total_bytes)
     
+    elapsed = time.perf_counter() - t0
     return {
         "status": "ok",
         "files": len(results),
-        "results": results
+        "results": results,
+        "bytes": total_bytes,
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "files_per_sec": round(len(results) / elapsed, 1) if elapsed else None,
+        "mb_per_sec": round(total_bytes / elapsed / 1e6, 3) if elapsed else None,
     }
@@ -7,7 +7,8 @@ import os
 import json
 import re
 from pathlib import Path
-from core import write_file
+from paste import write_stream, text_chunks, text_lines
+import timings
 
 
 PART_STORAGE = Path.home() / ".local" / "share" / "opencode" / "storage" / "part"
@@ -68,6 +69,32 @@ def _get_parts_for_msg(msg_id):
     return parts
 
 
+def _find_indexed(min_lines, nth):
+    """
+    Look the paste up in the persistent index (see pasteindex). Returns
+    (part, msg_id), raises ValueError if there is no such paste, or returns
+    None when the index is disabled or unusable so the caller scans instead.
+    """
+    import pasteindex
+    if not pasteindex.enabled():
+        return None
+    try:
+        import sqlite3
+    except ImportError:
+        return None
+    try:
+        found = pasteindex.find(MSG_STORAGE, PART_STORAGE, _extract_pasted_content,
+                                min_lines, nth)
+    except (sqlite3.Error, OSError):
+        return None
+    if found is None:
+        raise ValueError(
+            f"No paste >= {min_lines} lines found in recent user messages "
+            f"(searched {PART_STORAGE})"
+        )
+    return found
+
+
 def _extract_pasted_content(text):
     """Heuristic extraction: [Pasted ~N lines] marker > fenced code blocks > raw text."""
     # [Pasted ~N lines] marker from OpenCode's paste detection
@@ -89,73 +116,121 @@ def _extract_pasted_content(text):
     return text
 
 
+# Line boundaries as str.splitlines() sees them (regex character class)
+_SEP = r"\n\r\x0b\x0c\x1c-\x1e\x85\u2028\u2029"
+_OTHER_BREAKS = "\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+_LINE_BREAK = re.compile(rf"\r\n|[{_SEP}]")
+
+
+def _line_patterns(sep):
+    """
+    Line-start patterns for text whose line breaks are the characters in sep:
+    a line whose first non-blank character opens a JSON object/array, or an
+    XML element. Each comes as (at, search): `at` matches at a known line
+    start, `search` finds the next one from its preceding line break (a
+    leading break character lets the regex engine skip ahead quickly).
+    """
+    blank = rf"[^\S{sep}]*"
+    json_at = re.compile(blank + r"[{\[]")
+    xml_at = re.compile(blank + rf"<([a-zA-Z][\w.:_-]*)(?:[^\S{sep}]|>)")
+    return {
+        "blank": blank,
+        "json": (json_at, re.compile(rf"[{sep}]" + json_at.pattern)),
+        "xml": (xml_at, re.compile(rf"[{sep}]" + xml_at.pattern)),
+    }
+
+
+# Plain "\n" text (the common case) gets the faster single-character forms
+_LF_PATTERNS = _line_patterns(r"\n")
+_ANY_PATTERNS = _line_patterns(_SEP)
+# Inside a region only its own bracket pair counts, outside string literals.
+# Each match skips everything else (strings included) at C speed and ends at
+# the next run of those brackets, or at the end of the text. A backslash in a
+# string escapes the next character on any later line; an unterminated string
+# runs to the end, so its region never closes.
+_STRING = rf'"[^"\\]*(?:\\[{_SEP}]*[^{_SEP}][^"\\]*)*(?:"|[\s\S]*)'
+_REGION_TOKENS = {
+    "{": re.compile(rf'[^{{}}"]*(?:{_STRING}[^{{}}"]*)*(\{{+|\}}+|\Z)'),
+    "[": re.compile(rf'[^\[\]"]*(?:{_STRING}[^\[\]"]*)*(\[+|\]+|\Z)'),
+}
+
+
+def _next_line_start(patterns, text, pos):
+    """First match at or after line start pos, as (match, line start)."""
+    regex_at, regex = patterns
+    m = regex_at.match(text, pos)
+    if m is not None:
+        return m, pos
+    m = regex.search(text, pos)
+    if m is None:
+        return None, None
+    begin = m.start() + 1
+    return regex_at.match(text, begin), begin
+
+
 def _extract_structural_content(text):
     """Detect and extract JSON/XML/array content from mixed text.
 
-    JSON/array: bracket depth tracking for { } [ ].
+    JSON/array: bracket depth tracking for { } [ ], one region after another
+    in a single pass over the text.
     XML: first-last matching tag (e.g. <root>...</root>).
     Returns the largest region if it covers >= 80% of total lines.
     """
-    lines = text.splitlines()
-    if not lines:
+    if not text:
         return None
-
-    OPENERS = {'{': '}', '[': ']'}
-    best = None
-
-    scan_from = 0
-    while scan_from < len(lines):
-        start_idx = None
-        opener_char = None
-        for i in range(scan_from, len(lines)):
-            stripped = lines[i].lstrip()
-            if stripped and stripped[0] in OPENERS:
-                start_idx = i
-                opener_char = stripped[0]
-                break
-
-        if start_idx is None or opener_char is None:
+    exotic = any(c in text for c in _OTHER_BREAKS)
+    patterns = _ANY_PATTERNS if exotic else _LF_PATTERNS
+
+    def breaks(begin, end):
+        if exotic:
+            return sum(1 for _ in _LINE_BREAK.finditer(text, begin, end))
+        return text.count("\n", begin, end)
+
+    total_lines = breaks(0, len(text)) + (0 if _LINE_BREAK.match(text[-1]) else 1)
+    need = 0.8 * total_lines
+
+    best = None  # (span, begin, end_pos): begin starts the first line, end_pos is in the last
+    pos = 0
+    line_no, line_pos = 0, 0  # line number at line_pos, advanced incrementally
+    while True:
+        m, begin = _next_line_start(patterns["json"], text, pos)
+        if m is None:
             break
-
-        closer_char = OPENERS[opener_char]
+        start_line = line_no + breaks(line_pos, begin)
+        if total_lines - start_line < need:
+            break  # no region starting here can cover enough lines
+        opener = m.end() - 1
+        open_char = text[opener]
         depth = 0
-        end_idx = None
-        in_string = False
-        escape_next = False
-
-        for i in range(start_idx, len(lines)):
-            for ch in lines[i]:
-                if escape_next:
-                    escape_next = False
-                    continue
-                if ch == '\\' and in_string:
-                    escape_next = True
-                    continue
-                if ch == '"' and not escape_next:
-                    in_string = not in_string
-                    continue
-                if in_string:
-                    continue
-                if ch == opener_char:
-                    depth += 1
-                elif ch == closer_char:
-                    depth -= 1
-                    if depth == 0:
-                        end_idx = i
-                        break
-            if end_idx is not None:
+        close = None
+        for t in _REGION_TOKENS[open_char].finditer(text, opener):
+            run = t.end(1) - t.start(1)
+            if not run:
+                break  # end of text
+            if text[t.start(1)] == open_char:
+                depth += run
+            elif run >= depth:
+                close = t.start(1) + depth - 1
                 break
-
-        if end_idx is None:
+            else:
+                depth -= run
+        if close is None:
             break
 
-        span = end_idx - start_idx + 1
+        end_line = start_line + breaks(begin, close)
+        line_no, line_pos = end_line, close
+        span = end_line - start_line + 1
         if best is None or span > best[0]:
-            best = (span, start_idx, end_idx)
+            best = (span, begin, close)
+            if span >= need:
+                break  # the rest of the text is too short to hold a larger region
 
-        scan_from = end_idx + 1
+        after = _LINE_BREAK.search(text, close)
+        if after is None:
+            break
+        pos = after.end()
 
-    xml = _find_xml_region(lines)
+    xml = _find_xml_region(text, patterns, breaks)
     if xml is not None:
         if best is None or xml[0] > best[0]:
             best = xml
@@ -163,49 +238,42 @@ def _extract_structural_content(text):
     if best is None:
         return None
 
-    span, start_idx, end_idx = best
-    total_lines = len(lines)
+    span, begin, end_pos = best
     if total_lines > 0 and span / total_lines < 0.8:
         return None
 
-    return "\n".join(lines[start_idx:end_idx + 1])
-
+    after = _LINE_BREAK.search(text, end_pos)
+    region = text[begin:after.start() if after else len(text)]
+    return _LINE_BREAK.sub("\n", region) if exotic else region
 
-def _find_xml_region(lines):
-    xml_open = re.compile(r'^\s*<([a-zA-Z][\w.:_-]*)[\s>]')
-    start_idx = None
-    tag_name = None
 
-    for i, line in enumerate(lines):
-        m = xml_open.match(line)
-        if m:
-            start_idx = i
-            tag_name = m.group(1)
-            break
-
-    if start_idx is None or tag_name is None:
+def _find_xml_region(text, patterns, breaks):
+    m, begin = _next_line_start(patterns["xml"], text, 0)
+    if m is None:
         return None
 
-    close_pat = re.compile(r'</\s*' + re.escape(tag_name) + r'\s*>')
-    end_idx = None
-    for i in range(len(lines) - 1, start_idx - 1, -1):
-        if close_pat.search(lines[i]):
-            end_idx = i
-            break
-
-    if end_idx is None or end_idx == start_idx:
+    blank = patterns["blank"]
+    close_pat = re.compile("</" + blank + re.escape(m.group(1)) + blank + ">")
+    last = None
+    for last in close_pat.finditer(text, m.end(1)):
+        pass
+    if last is None:
+        return None
+    span_breaks = breaks(begin, last.start())
+    if span_breaks == 0:
         return None
 
-    span = end_idx - start_idx + 1
-    return (span, start_idx, end_idx)
+    return (span_breaks + 1, begin, last.start())
 
 
-def extract_code_blocks(text):
-    pattern = r"```[\w]*\n?([\s\S]*?)```"
-    blocks = re.findall(pattern, text)
-    if blocks:
-        return "\n".join(blocks)
-    return text
+def _found(content, msg_id, part_id, lines):
+    return {
+        "text": content,
+        "msg_id": msg_id,
+        "part_id": part_id,
+        "lines": lines,
+        "bytes": len(content.encode("utf-8")),
+    }
 
 
 def find_large_paste(min_lines=DEFAULT_MIN_LINES, msg_id=None, nth=1):
@@ -235,18 +303,19 @@ def find_large_paste(min_lines=DEFAULT_MIN_LINES, msg_id=None, nth=1):
         for part in parts:
             text = part["text"]
             content = _extract_pasted_content(text)
-            if len(content.splitlines()) >= min_lines:
-                return {
-                    "text": content,
-                    "msg_id": msg_id,
-                    "part_id": part["id"],
-                    "lines": len(content.splitlines()),
-                    "bytes": len(content.encode("utf-8")),
-                }
+            lines = text_lines(content)
+            if lines >= min_lines:
+                return _found(content, msg_id, part["id"], lines)
         raise ValueError(
             f"No paste >= {min_lines} lines found in message {msg_id}"
         )
 
+    indexed = _find_indexed(min_lines, nth)
+    if indexed is not None:
+        part, uid = indexed
+        content = _extract_pasted_content(part["text"])
+        return _found(content, uid, part["id"], text_lines(content))
+
     user_msg_ids = _find_user_msg_ids(limit=50)
     if not user_msg_ids:
         raise ValueError("No user messages found in OpenCode storage")
@@ -257,16 +326,11 @@ def find_large_paste(min_lines=DEFAULT_MIN_LINES, msg_id=None, nth=1):
         for part in parts:
             text = part["text"]
             content = _extract_pasted_content(text)
-            if len(content.splitlines()) >= min_lines:
+            lines = text_lines(content)
+            if lines >= min_lines:
                 found_count += 1
                 if found_count == nth:
-                    return {
-                        "text": content,
-                        "msg_id": uid,
-                        "part_id": part["id"],
-                        "lines": len(content.splitlines()),
-                        "bytes": len(content.encode("utf-8")),
-                    }
+                    return _found(content, uid, part["id"], lines)
 
     raise ValueError(
         f"No paste >= {min_lines} lines found in recent {len(user_msg_ids)} "
@@ -275,7 +339,8 @@ def find_large_paste(min_lines=DEFAULT_MIN_LINES, msg_id=None, nth=1):
 
 
 def save_pasted(filepath, min_lines=DEFAULT_MIN_LINES, msg_id=None,
-                extract=False, nth=1):
+                extract=False, nth=1, durability=None, line_ending=None,
+                skip_unchanged=None):
     """
     Find the latest large paste and save it to a file.
     
@@ -285,23 +350,32 @@ def save_pasted(filepath, min_lines=DEFAULT_MIN_LINES, msg_id=None,
         msg_id: Specific message ID (optional)
         extract: Extract code from ```...``` blocks
         nth: Which large paste (1=most recent)
+        durability: "none" | "file" | "file+dir" (see core.durability_mode)
+        line_ending: "lf" | "crlf" to normalize line breaks; None, "auto" or
+            "preserve" to keep them
+        skip_unchanged: leave the file untouched if the content is identical
+            (default: $FAST_EDIT_SKIP_UNCHANGED)
     
     Returns:
         dict with status, file, lines, bytes, msg_id, part_id
+        (and "unchanged": true when the file was left as it was)
     """
-    result = find_large_paste(min_lines=min_lines, msg_id=msg_id, nth=nth)
-    content = result["text"]
-
-    if extract:
-        content = extract_code_blocks(content)
+    with timings.phase("find"):
+        result = find_large_paste(min_lines=min_lines, msg_id=msg_id, nth=nth)
 
-    write_file(filepath, content)
+    lines, size, same = write_stream(
+        filepath, text_chunks(result["text"]), "save-pasted", extract=extract,
+        line_ending=line_ending, durability=durability, skip_unchanged=skip_unchanged,
+    )
 
-    return {
+    saved = {
         "status": "ok",
         "file": os.path.abspath(filepath),
-        "lines": len(content.splitlines()),
-        "bytes": len(content.encode("utf-8")),
+        "lines": lines,
+        "bytes": size,
         "msg_id": result["msg_id"],
         "part_id": result["part_id"],
     }
+    if same:
+        saved["unchanged"] = True
+    return saved
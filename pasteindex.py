@@ -0,0 +1,264 @@
+"""
+Persistent index of OpenCode's message and part storage, for save-pasted.
+
+OpenCode keeps one JSON file per message (message/<session>/<msg>.json) and
+per part (part/<msg>/<part>.json). Scanning and parsing them on every call
+gets slow once months of history pile up, so their metadata (role, creation
+time, part type and start time, line count of the pasted content, content
+hash) is kept in a sqlite database under $XDG_STATE_HOME/fast-edit/pasted.
+Each refresh re-lists only the directories whose mtime changed since the
+last one, and only the parts of user messages are indexed.
+
+Set FAST_EDIT_PASTE_INDEX=off to always scan the storage directly.
+"""
+import os
+import json
+import time
+
+import settings
+from core import state_dir
+
+
+PASTE_INDEX_ENV = "FAST_EDIT_PASTE_INDEX"
+# Bump when the schema or the line-count heuristic changes
+SCHEMA_VERSION = 2
+# A directory modified this recently may change again within the same mtime
+# tick, so it is rescanned next time instead of being marked clean
+RACY_SECONDS = 2
+# Part directories of this many newest user messages are rechecked every time
+RECHECK_RECENT = 50
+# Searched like pasted's direct scan: the newest user messages of the most
+# recently active sessions, session by session
+SEARCH_SESSIONS = 5
+SEARCH_MESSAGES = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS sessions (path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS messages (
+    file TEXT PRIMARY KEY, id TEXT NOT NULL, session TEXT NOT NULL,
+    role TEXT, created INTEGER NOT NULL, parts_mtime_ns INTEGER NOT NULL DEFAULT -1
+);
+CREATE INDEX IF NOT EXISTS messages_id ON messages (id);
+CREATE INDEX IF NOT EXISTS messages_session ON messages (session, created);
+CREATE INDEX IF NOT EXISTS messages_recent ON messages (role, created);
+CREATE INDEX IF NOT EXISTS messages_unsettled ON messages (id) WHERE parts_mtime_ns < 0;
+CREATE TABLE IF NOT EXISTS parts (
+    path TEXT PRIMARY KEY, id TEXT, msg_id TEXT NOT NULL, type TEXT,
+    start INTEGER NOT NULL, lines INTEGER NOT NULL, bytes INTEGER NOT NULL,
+    hash TEXT
+);
+CREATE INDEX IF NOT EXISTS parts_msg ON parts (msg_id);
+"""
+
+
+def enabled():
+    return settings.get(PASTE_INDEX_ENV, "").lower() not in ("0", "off", "false", "no")
+
+
+def index_path():
+    return os.path.join(state_dir("pasted"), "index.sqlite")
+
+
+def content_hash(text):
+    from zlib import crc32
+    data = text.encode("utf-8")
+    return f"{crc32(data):08x}-{len(data)}"
+
+
+def _load(path):
+    try:
+        with open(path, "rb") as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _connect(msg_root, part_root):
+    import sqlite3
+    path = index_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    roots = f"{msg_root}\0{part_root}"
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version == SCHEMA_VERSION:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'roots'").fetchone()
+        if row is not None and row[0] == roots:
+            return conn
+    # New database, other schema or other storage location: start over
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table in ("meta", "sessions", "messages", "parts"):
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+        for statement in _SCHEMA.split(";"):
+            conn.execute(statement)
+        conn.execute("INSERT INTO meta VALUES ('roots', ?)", (roots,))
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        conn.close()
+        raise
+    return conn
+
+
+def _changed(known, racy_after):
+    """(path, mtime_ns to record) of directories whose mtime differs from known[path]."""
+    for path, indexed in known.items():
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            if indexed is not None:
+                yield path, -1  # removed: drop what was indexed from it
+            continue
+        if indexed != mtime:
+            yield path, (mtime if mtime < racy_after else -1)
+
+
+def _index_part(conn, path, msg_id, measure):
+    data = _load(path)
+    if not isinstance(data, dict):
+        conn.execute("DELETE FROM parts WHERE path = ?", (path,))
+        return
+    text = data.get("text") if data.get("type") == "text" else None
+    lines = size = 0
+    digest = None
+    if text:
+        content = measure(text)
+        lines = len(content.splitlines())
+        size = len(content.encode("utf-8"))
+        digest = content_hash(text)
+    start = (data.get("time") or {}).get("start") or 0
+    conn.execute(
+        "INSERT OR REPLACE INTO parts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (path, data.get("id"), msg_id, data.get("type"), start, lines, size, digest),
+    )
+
+
+def _sync_dir(conn, table, column, key, directory, parse):
+    """Index files added to directory since the last scan and drop deleted ones."""
+    try:
+        present = {e.path for e in os.scandir(directory) if e.name.endswith(".json")}
+    except OSError:
+        present = set()
+    indexed = {row[0] for row in conn.execute(
+        f"SELECT {column} FROM {table} WHERE {key[0]} = ?", (key[1],))}
+    conn.executemany(f"DELETE FROM {table} WHERE {column} = ?",
+                     [(p,) for p in indexed - present])
+    for path in sorted(present - indexed):
+        parse(path)
+
+
+def refresh(conn, msg_root, part_root, measure):
+    """Bring the index up to date with the storage directories."""
+    racy_after = time.time_ns() - RACY_SECONDS * 1_000_000_000
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        known = dict(conn.execute("SELECT path, mtime_ns FROM sessions"))
+        try:
+            sessions = {e.path: known.get(e.path) for e in os.scandir(msg_root) if e.is_dir()}
+        except OSError:
+            sessions = {}
+        sessions.update((path, mtime) for path, mtime in known.items() if path not in sessions)
+        marks = []
+        for session_dir, mtime in _changed(sessions, racy_after):
+            session = os.path.basename(session_dir)
+
+            def parse_message(path, session=session):
+                meta = _load(path)
+                if not isinstance(meta, dict) or "id" not in meta:
+                    return
+                created = (meta.get("time") or {}).get("created")
+                if created is None:
+                    created = os.stat(path).st_mtime_ns // 1_000_000
+                conn.execute(
+                    "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, -1)",
+                    (path, meta["id"], session, meta.get("role"), created),
+                )
+
+            _sync_dir(conn, "messages", "file", ("session", session), session_dir, parse_message)
+            marks.append((session_dir, mtime))
+        conn.executemany("INSERT OR REPLACE INTO sessions VALUES (?, ?)", marks)
+        if marks:
+            conn.execute("DELETE FROM parts WHERE msg_id NOT IN (SELECT id FROM messages)")
+
+        # Parts can arrive after their message: recheck the part directories
+        # of the newest user messages and of any not yet seen settled
+        part_dirs = {}
+        for msg_id, mtime in conn.execute(
+                "SELECT id, parts_mtime_ns FROM messages WHERE role = 'user' "
+                "ORDER BY created DESC LIMIT ?", (RECHECK_RECENT,)):
+            part_dirs[os.path.join(part_root, msg_id)] = mtime
+        for (msg_id,) in conn.execute(
+                "SELECT id FROM messages WHERE parts_mtime_ns < 0 AND role = 'user'"):
+            part_dirs[os.path.join(part_root, msg_id)] = -1
+        for part_dir, mtime in _changed(part_dirs, racy_after):
+            msg_id = os.path.basename(part_dir)
+            _sync_dir(conn, "parts", "path", ("msg_id", msg_id), part_dir,
+                      lambda path, m=msg_id: _index_part(conn, path, m, measure))
+            conn.execute("UPDATE messages SET parts_mtime_ns = ? WHERE id = ?", (mtime, msg_id))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _candidates(conn, min_lines):
+    return conn.execute(
+        "WITH s AS (SELECT session, MAX(created) AS active FROM messages "
+        "           GROUP BY session ORDER BY active DESC LIMIT ?), "
+        "m AS (SELECT messages.id, messages.created, s.active FROM messages "
+        "      JOIN s ON s.session = messages.session WHERE messages.role = 'user' "
+        "      ORDER BY s.active DESC, messages.created DESC LIMIT ?) "
+        "SELECT p.path, p.msg_id, p.hash FROM parts p JOIN m ON m.id = p.msg_id "
+        "WHERE p.type = 'text' AND p.hash IS NOT NULL AND p.lines >= ? "
+        "ORDER BY m.active DESC, m.created DESC, p.start DESC",
+        (SEARCH_SESSIONS, SEARCH_MESSAGES, min_lines))
+
+
+def find(msg_root, part_root, measure, min_lines, nth=1):
+    """
+    The nth most recent text part of a user message whose measured content
+    has at least min_lines lines, as (part data, msg_id), or None. Only the
+    SEARCH_MESSAGES newest user messages of the SEARCH_SESSIONS most recently
+    active sessions are searched.
+    measure(text) -> the content whose lines are counted.
+    Raises sqlite3.Error / OSError if the index cannot be used.
+    """
+    conn = _connect(str(msg_root), str(part_root))
+    try:
+        refresh(conn, str(msg_root), str(part_root), measure)
+        retried = set()
+        unusable = set()
+        while True:
+            found = 0
+            stale = None
+            for path, owner, digest in _candidates(conn, min_lines):
+                if path in unusable:
+                    continue
+                found += 1
+                if found < nth:
+                    continue
+                data = _load(path)
+                text = data.get("text") if isinstance(data, dict) else None
+                if text and content_hash(text) == digest:
+                    return data, owner
+                stale = (path, owner)
+                break
+            if stale is None:
+                return None
+            if stale[0] in retried:
+                # Still no match after re-indexing (unreadable, or rewritten
+                # again meanwhile): pass over it like the direct scan would
+                unusable.add(stale[0])
+                continue
+            retried.add(stale[0])
+            # Rewritten in place since it was indexed: re-measure and retry
+            conn.execute("BEGIN IMMEDIATE")
+            _index_part(conn, stale[0], stale[1], measure)
+            conn.execute("COMMIT")
+    finally:
+        conn.close()
@@ -0,0 +1,326 @@
+"""
+Warm type-checker sessions, one per (checker, project root).
+
+mypy runs through dmypy, which is its own daemon. It is started on first use
+with --timeout, so it exits by itself once idle, and later checks from any
+process reuse it. The pyright family runs as a language server (LSP over
+stdio). A server can only stay warm inside a long-lived process, so these
+sessions are used only when `persistent` is set, which `serve` does. Idle
+servers are shut down after FAST_EDIT_CHECK_IDLE seconds.
+"""
+import os
+import json
+import time
+import shutil
+import threading
+import subprocess
+from urllib.parse import quote
+
+import settings
+from core import state_dir
+
+
+CHECK_IDLE_ENV = "FAST_EDIT_CHECK_IDLE"
+DEFAULT_IDLE = 600
+# Files that mark a project root (searched upward from the checked file)
+ROOT_MARKERS = (
+    "pyproject.toml", "setup.cfg", "setup.py", "mypy.ini", ".mypy.ini",
+    "pyrightconfig.json", ".git",
+)
+LANGSERVERS = {
+    "basedpyright": "basedpyright-langserver",
+    "pyright": "pyright-langserver",
+}
+
+# Set by the daemon: language servers outlive a single check only there
+persistent = False
+
+_servers = {}
+_servers_lock = threading.Lock()
+_reaper = None
+
+
+def idle_timeout():
+    value = settings.get(CHECK_IDLE_ENV)
+    return float(value) if value else DEFAULT_IDLE
+
+
+def project_root(filepath):
+    """Nearest ancestor of filepath holding a project marker, else its directory."""
+    directory = os.path.dirname(os.path.abspath(filepath))
+    candidate = directory
+    while True:
+        if any(os.path.exists(os.path.join(candidate, m)) for m in ROOT_MARKERS):
+            return candidate
+        parent = os.path.dirname(candidate)
+        if parent == candidate:
+            return directory
+        candidate = parent
+
+
+def _root_key(root):
+    from zlib import crc32
+    return f"{os.path.basename(root) or 'root'}-{crc32(root.encode('utf-8')):08x}"
+
+
+# --- mypy: dmypy -----------------------------------------------------------
+
+def _dmypy_alive(status_file):
+    try:
+        with open(status_file) as f:
+            pid = json.load(f)["pid"]
+        os.kill(pid, 0)
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+    return True
+
+
+def dmypy_run(root, files, flags, timeout):
+    """
+    Check files through the dmypy daemon for root, starting it if needed.
+    Returns (output, warm); warm is False when this call started the daemon.
+    Raises FileNotFoundError if dmypy is not installed.
+    """
+    exe = shutil.which("dmypy")
+    if exe is None:
+        raise FileNotFoundError("dmypy not found")
+    directory = state_dir("checkers")
+    os.makedirs(directory, exist_ok=True)
+    status_file = os.path.join(directory, f"dmypy-{_root_key(root)}.json")
+    warm = _dmypy_alive(status_file)
+
+    cmd = [
+        exe, "--status-file", status_file, "run",
+        "--timeout", str(int(idle_timeout())), "--", *flags, *files,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, cwd=root)
+    return result.stdout + result.stderr, warm
+
+
+# --- pyright family: language server ---------------------------------------
+
+def file_uri(path):
+    return "file://" + quote(os.path.abspath(path))
+
+
+class LanguageServer:
+    """A pyright-family language server for one project root, driven over stdio."""
+
+    def __init__(self, executable, root, timeout):
+        self.root = root
+        self.proc = subprocess.Popen(
+            [executable, "--stdio"], cwd=root,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        self.write_lock = threading.Lock()
+        self.check_lock = threading.Lock()
+        self.cond = threading.Condition()
+        self.next_id = 0
+        self.responses = {}
+        self.published = {}  # uri -> (version, diagnostics)
+        self.versions = {}   # uri -> last version sent
+        self.closed = False
+        self.last_used = time.monotonic()
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+        try:
+            self.request("initialize", {
+                "processId": os.getpid(),
+                "rootUri": file_uri(root),
+                "workspaceFolders": [{"uri": file_uri(root), "name": os.path.basename(root)}],
+                "capabilities": {
+                    "textDocument": {"publishDiagnostics": {"versionSupport": True}},
+                    "workspace": {"configuration": True, "workspaceFolders": True},
+                },
+            }, timeout)
+            self.notify("initialized", {})
+        except BaseException:
+            # Nobody will ever close a server that failed to start: reap it here
+            self.closed = True
+            self.proc.kill()
+            self.proc.wait()
+            raise
+
+    # Framing (Content-Length headers, JSON-RPC 2.0)
+
+    def _send(self, message):
+        body = json.dumps(message).encode("utf-8")
+        with self.write_lock:
+            self.proc.stdin.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            self.proc.stdin.flush()
+
+    def _receive(self):
+        stream = self.proc.stdout
+        length = None
+        while True:
+            line = stream.readline()
+            if not line:
+                return None
+            line = line.strip()
+            if not line:
+                break
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length":
+                length = int(value)
+        return json.loads(stream.read(length)) if length is not None else {}
+
+    def _read_loop(self):
+        while True:
+            try:
+                message = self._receive()
+            except (OSError, ValueError):
+                message = None
+            if message is None:
+                with self.cond:
+                    self.closed = True
+                    self.cond.notify_all()
+                return
+
+            method = message.get("method")
+            if method is not None and "id" in message:
+                # Server -> client request: answer with defaults
+                result = None
+                if method == "workspace/configuration":
+                    result = [None] * len(message.get("params", {}).get("items", []))
+                self._send({"jsonrpc": "2.0", "id": message["id"], "result": result})
+            elif method == "textDocument/publishDiagnostics":
+                params = message["params"]
+                uri = params["uri"]
+                with self.cond:
+                    version = params.get("version", self.versions.get(uri))
+                    self.published[uri] = (version, params["diagnostics"])
+                    self.cond.notify_all()
+            elif method is None and "id" in message:
+                with self.cond:
+                    self.responses[message["id"]] = message
+                    self.cond.notify_all()
+
+    def _wait(self, ready, timeout):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while not ready():
+                if self.closed:
+                    raise RuntimeError("language server exited")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"language server did not answer within {timeout}s")
+                self.cond.wait(remaining)
+
+    def request(self, method, params, timeout):
+        with self.cond:
+            self.next_id += 1
+            request_id = self.next_id
+        self._send({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+        self._wait(lambda: request_id in self.responses, timeout)
+        with self.cond:
+            response = self.responses.pop(request_id)
+        if "error" in response:
+            raise RuntimeError(response["error"].get("message", "language server error"))
+        return response.get("result")
+
+    def notify(self, method, params):
+        self._send({"jsonrpc": "2.0", "method": method, "params": params})
+
+    def diagnostics(self, files, timeout):
+        """
+        Sync files' current contents to the server and wait for fresh
+        diagnostics. Returns {path: [LSP diagnostic, ...]}.
+        """
+        with self.check_lock:
+            self.last_used = time.monotonic()
+            expected = {}
+            for path in files:
+                uri = file_uri(path)
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    text = f.read()
+                with self.cond:
+                    version = self.versions.get(uri, 0) + 1
+                    self.versions[uri] = version
+                if version == 1:
+                    self.notify("textDocument/didOpen", {"textDocument": {
+                        "uri": uri, "languageId": "python", "version": version, "text": text,
+                    }})
+                else:
+                    self.notify("textDocument/didChange", {
+                        "textDocument": {"uri": uri, "version": version},
+                        "contentChanges": [{"text": text}],
+                    })
+                expected[uri] = version
+
+            def fresh():
+                return all(
+                    ((self.published.get(uri) or (0,))[0] or 0) >= version
+                    for uri, version in expected.items()
+                )
+
+            self._wait(fresh, timeout)
+            self.last_used = time.monotonic()
+            with self.cond:
+                return {path: self.published[file_uri(path)][1] for path in files}
+
+    def close(self):
+        try:
+            self.request("shutdown", None, 5)
+            self.notify("exit", None)
+            self.proc.wait(5)
+        except Exception:
+            self.proc.kill()
+            self.proc.wait()
+
+
+def language_server(checker, root, timeout):
+    """
+    Return (server, warm) for checker at root, starting one if needed; None
+    when sessions are not persistent or no language server is installed.
+    """
+    if not persistent or checker not in LANGSERVERS:
+        return None
+    executable = shutil.which(LANGSERVERS[checker])
+    if executable is None:
+        return None
+
+    key = (checker, root)
+    with _servers_lock:
+        server = _servers.get(key)
+        if server is not None and not server.closed:
+            return server, True
+        server = LanguageServer(executable, root, timeout)
+        _servers[key] = server
+        _start_reaper()
+    return server, False
+
+
+def _start_reaper():
+    global _reaper
+    if _reaper is None:
+        _reaper = threading.Thread(target=_reap_loop, daemon=True)
+        _reaper.start()
+
+
+def _reap_loop():
+    # This thread never installs a request's settings, so it uses the
+    # process-wide FAST_EDIT_CHECK_IDLE: servers are shared across requests
+    while True:
+        idle = idle_timeout()
+        time.sleep(min(idle, 30.0))
+        reap(idle)
+
+
+def reap(idle):
+    """Shut down language servers unused for idle seconds."""
+    now = time.monotonic()
+    with _servers_lock:
+        stale = [k for k, s in _servers.items()
+                 if s.closed or (now - s.last_used >= idle and not s.check_lock.locked())]
+        servers = [_servers.pop(k) for k in stale]
+    for server in servers:
+        server.close()
+
+
+def shutdown_all():
+    """Shut down every language server (daemon exit)."""
+    with _servers_lock:
+        servers = list(_servers.values())
+        _servers.clear()
+    for server in servers:
+        server.close()
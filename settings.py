@@ -0,0 +1,58 @@
+"""
+FAST_EDIT_* settings of the command being run.
+
+Modules read their FAST_EDIT_* environment variables through get(). From
+the CLI that is os.environ; inside the daemon each request carries the
+caller's FAST_EDIT_* variables, and using() installs them for the thread
+running it, so a client sees the same results as the CLI would give it:
+
+    with settings.using({"FAST_EDIT_TIMINGS": "1"}):
+        fast_edit.execute(args)
+"""
+import os
+from _thread import _local
+
+
+PREFIX = "FAST_EDIT_"
+
+_state = _local()
+
+
+def caller_env(environ=None):
+    """The FAST_EDIT_* variables of environ (default: os.environ), as sent with a request."""
+    environ = os.environ if environ is None else environ
+    return {name: value for name, value in environ.items() if name.startswith(PREFIX)}
+
+
+def current():
+    """The variables installed for this thread by using(), or None (os.environ applies)."""
+    return getattr(_state, "env", None)
+
+
+def get(name, default=None):
+    """Value of a FAST_EDIT_* variable for the current command."""
+    env = getattr(_state, "env", None)
+    if env is None:
+        return os.environ.get(name, default)
+    return env.get(name, default)
+
+
+class using:
+    """
+    Install env (a caller_env() dict) for the current thread for the
+    duration of a with block; None keeps os.environ. Worker threads and
+    processes must install it themselves.
+    """
+
+    def __init__(self, env):
+        self.env = env
+
+    def __enter__(self):
+        self.previous = getattr(_state, "env", None)
+        if self.env is not None:
+            _state.env = self.env
+        return self.env
+
+    def __exit__(self, *exc):
+        _state.env = self.previous
+        return False
@@ -0,0 +1,121 @@
+"""
+Per-phase timings for command results (--timings or FAST_EDIT_TIMINGS=1).
+
+Commands wrap their phases in `with timings.phase(name):` and report sizes
+with timings.count(name, n). Both go to the recorder that record() installs
+for the current thread and do nothing otherwise, so the instrumentation
+costs one function call per phase when it is off. From the library API:
+
+    with timings.record() as rec:
+        edit.batch(spec)
+    rec.result()  # {"total_ms": ..., "phases": {"plan_ms": ...}, "counts": {...}}
+"""
+import time
+from _thread import _local
+
+import settings
+
+
+TIMINGS_ENV = "FAST_EDIT_TIMINGS"
+
+_state = _local()
+
+
+def enabled(flag=False):
+    """Whether results get a "timings" object (--timings or FAST_EDIT_TIMINGS=1)."""
+    return flag or settings.get(TIMINGS_ENV, "").lower() in ("1", "on", "true", "yes")
+
+
+class Timings:
+    """Phase durations and counters accumulated over one command."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stop = None
+        self.phases = {}
+        self.counts = {}
+
+    def add(self, name, ms):
+        self.phases[name] = self.phases.get(name, 0.0) + ms
+
+    def count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def result(self):
+        """
+        JSON form: total, each phase (repeated phases are summed) and the
+        time spent outside any phase as "other_ms".
+        """
+        total = ((self.stop or time.perf_counter()) - self.start) * 1000
+        phases = {f"{name}_ms": round(ms, 3) for name, ms in self.phases.items()}
+        phases["other_ms"] = round(max(0.0, total - sum(self.phases.values())), 3)
+        return {"total_ms": round(total, 3), "phases": phases, "counts": dict(self.counts)}
+
+
+class _Phase:
+    __slots__ = ("recorder", "name", "t0")
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.add(self.name, (time.perf_counter() - self.t0) * 1000)
+        return False
+
+
+class _Off:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_OFF = _Off()
+
+
+def current():
+    """The recorder active in this thread, or None."""
+    return getattr(_state, "recorder", None)
+
+
+def phase(name):
+    """Context manager charging the time spent inside it to phase name."""
+    recorder = getattr(_state, "recorder", None)
+    return _OFF if recorder is None else _Phase(recorder, name)
+
+
+def count(name, n):
+    """Add n to counter name (bytes, lines, files, ...)."""
+    recorder = getattr(_state, "recorder", None)
+    if recorder is not None:
+        recorder.count(name, n)
+
+
+class record:
+    """
+    Install a fresh Timings for the current thread for the duration of a
+    with block; yields None (and records nothing) when on is false.
+    Worker threads and processes record into their own recorders.
+    """
+
+    def __init__(self, on=True):
+        self.recorder = Timings() if on else None
+
+    def __enter__(self):
+        self.previous = getattr(_state, "recorder", None)
+        _state.recorder = self.recorder
+        return self.recorder
+
+    def __exit__(self, *exc):
+        _state.recorder = self.previous
+        if self.recorder is not None:
+            self.recorder.stop = time.perf_counter()
+        return False